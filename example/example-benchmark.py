@@ -0,0 +1,768 @@
+# -*- coding:utf-8 -*-
+# Micro benchmarks of the SDK hot paths, run against synthetic frames so no
+# VisionSeed needs to be connected.
+from visionseed import AsyncYtVisionSeed, YtVisionSeed, YtVisionSeedClient, YtDataLink, YtFrameQueue, YtMsg, YtRpc, crcCcitt
+from visionseed import YtFaceShape, video
+import asyncio
+import numpy as np
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+
+class LoopbackPort:
+    '''
+    Minimal stand-in for serial.Serial: read() serves the bytes given at
+    construction, write() collects everything the SDK sends.
+    '''
+    def __init__(self, data=b''):
+        self.data = b'\x00' + data
+        self.pos = 0
+        self.reads = 0
+        self.written = bytearray(0)
+
+    @property
+    def in_waiting(self):
+        return len(self.data) - self.pos
+
+    def read(self, size=1):
+        self.reads += 1
+        ret = self.data[self.pos : self.pos + size]
+        self.pos += len(ret)
+        return ret
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+
+class DevicePort:
+    '''
+    Stand-in for a VisionSeed on a serial port: every RPC written is
+    answered latency seconds later, read() blocks up to timeout for data.
+    With period set, a result frame is streamed every period seconds.
+    Payloads that do not parse as a YtMsg are counted in corrupt.
+    '''
+    def __init__(self, latency, timeout=0.5, period=None, faceCount=2):
+        self.latency = latency
+        self.timeout = timeout
+        self.data = bytearray(b'\x00')
+        self.cond = threading.Condition()
+        self.deframer = YtDataLink.YtDeframer()
+        self.running = True
+        self.rpcs = 0
+        self.corrupt = 0
+        if period:
+            threading.Thread(target=self.stream, args=(period, faceCount), daemon=True).start()
+
+    def stream(self, period, faceCount):
+        rand = random.Random(0)
+        frameId = 0
+        while self.running:
+            frameId += 1
+            self.respond(encodeStream([makeResultMsg(frameId, faceCount, rand)]))
+            time.sleep(period)
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size=1):
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.data) >= size or not self.running, self.timeout)
+            ret = bytes(self.data[:size])
+            del self.data[:size]
+            return ret
+
+    def respond(self, data):
+        with self.cond:
+            self.data += data
+            self.cond.notify_all()
+
+    def write(self, data):
+        self.deframer.feed(data)
+        while True:
+            payload = self.deframer.next()
+            if payload is None:
+                break
+            try:
+                rpc = YtMsg.FromString(bytes(payload)).rpc
+            except Exception:
+                self.corrupt += 1
+                continue
+            self.rpcs += 1
+            resp = YtMsg()
+            resp.response.sequenceId = rpc.sequenceId
+            resp.response.code = 0
+            if rpc.func == YtRpc.getDeviceInfo:
+                resp.response.strData = 'VisionSeed %d' % rpc.sequenceId
+            threading.Timer(self.latency, self.respond, (encodeStream([resp]),)).start()
+        return len(data)
+
+    def close(self):
+        self.running = False
+        self.respond(b'')
+
+
+class LegacyYtDataLink(YtDataLink):
+    '''
+    The per-byte receive state machine and escape encoder the SDK shipped
+    before the bulk deframer/encoder, kept here as the baseline.
+    '''
+    def __init__(self, port):
+        super().__init__(port)
+        self.array = bytearray(0)
+        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
+        self.mMsgLen = 0
+        self.mCrc = 0
+        self.mTrans = False
+
+    def recvRunOnce(self):
+        if len(self.array) < 10:
+            self.array += self.port.read(16)
+        while len(self.array) > 0:
+            ch = self.array.pop(0)
+            if (ch == self.SOF):
+                self.mStatus = self.YtDataLinkStatus.YT_DL_LEN1_PENDING
+            elif (ch == self.TRANS):
+                self.mTrans = True
+            else:
+                if (self.mTrans):
+                    ch = ch ^ self.TRANS
+                    self.mTrans = False
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING):
+                    self.mMsgLen = 0
+                    self.mCrc = 0
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING or
+                    self.mStatus == self.YtDataLinkStatus.YT_DL_LEN2_PENDING or
+                    self.mStatus == self.YtDataLinkStatus.YT_DL_LEN3_PENDING):
+                    self.crcUpdate(ch, self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING)
+                    self.mMsgLen = (self.mMsgLen << 8) | ch
+                    if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN3_PENDING):
+                        if (self.mMsgLen > self.ytMsgSize):
+                            self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
+                            continue
+                    self.mStatus = self.mStatus + 1
+                    continue
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN_CRC_H):
+                    self.mCrc = (self.mCrc << 8) | ch
+                    self.mStatus = self.mStatus + 1
+                    continue
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN_CRC_L):
+                    self.mCrc = (self.mCrc << 8) | ch
+                    if ((self.mCrcCalc) != self.mCrc):
+                        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
+                        continue
+                    self.mStatus = self.mStatus + 1
+                    self.mBuf = bytearray(self.mMsgLen)
+                    self.mBufi = 0
+                    self.array += self.port.read(self.mMsgLen)
+                    continue
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_DATA):
+                    self.crcUpdate(ch, self.mBufi == 0)
+                    self.mBuf[self.mBufi] = ch
+                    self.mBufi += 1
+                    if (self.mBufi == self.mMsgLen):
+                        self.mStatus = self.mStatus + 1
+                    continue
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_H):
+                    self.mCrc = 0
+                if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_H or
+                    self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_L):
+                    self.mCrc = (self.mCrc << 8) | ch
+                    if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_L):
+                        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
+                        if ((self.mCrcCalc) != self.mCrc):
+                            continue
+                        return self.parseYtMsg(self.mBuf)
+                    self.mStatus = self.mStatus + 1
+                    continue
+        return None, None
+
+    def write(self, data):
+        buf = bytearray(len(data) + 8)
+        buf[0] = 0x10
+        buf[1] = (len(data) >> 16) & 0xff
+        buf[2] = (len(data) >> 8) & 0xff
+        buf[3] = (len(data) >> 0) & 0xff
+        self.crcSendUpdate(buf[1], True)
+        self.crcSendUpdate(buf[2])
+        self.crcSendUpdate(buf[3])
+        buf[4] = (self.mCrcSendCalc >> 8) & 0xff
+        buf[5] = (self.mCrcSendCalc >> 0) & 0xff
+        buf[6:] = data
+        buf.append(0)
+        buf.append(0)
+        transLen = 0
+        for i in range(1, len(buf)):
+            if (i >= 6 and i < len(buf) - 2):
+                self.crcSendUpdate(buf[i], i == 6)
+            if (buf[i] == 0x10 or buf[i] == 0x11):
+                transLen += 1
+        buf[len(buf) - 2] = (self.mCrcSendCalc >> 8) & 0xff
+        buf[len(buf) - 1] = (self.mCrcSendCalc >> 0) & 0xff
+        for i in range(len(buf)-2, len(buf)):
+            if (buf[i] == 0x10 or buf[i] == 0x11):
+                transLen += 1
+        idx = 0
+        transedBuffer = bytearray(len(buf) + transLen)
+        for i in range(0, len(buf)):
+            if ((buf[i] == 0x10 or buf[i] == 0x11) and i > 0):
+                transedBuffer[idx] = 0x11
+                idx += 1
+                transedBuffer[idx] = buf[i] ^ 0x11
+                idx += 1
+            else:
+                transedBuffer[idx] = buf[i]
+                idx += 1
+        self.port.write(transedBuffer)
+
+
+# Synthetic DataV2 frames
+def packVarUInt32(value):
+    ret = bytearray(0)
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            ret.append(byte | 0x80)
+        else:
+            ret.append(byte)
+            return bytes(ret)
+
+def packEntry(path, type, data):
+    return bytes([len(path)]) + bytes(path) + bytes([type]) + packVarUInt32(len(data)) + data
+
+def makeDataV2(faceCount, rand):
+    Model = YtDataLink.YtVisionSeedModel
+    Type = YtDataLink.YtVisionSeedResultType
+    entries = [packEntry([Model.FACE_DETECTION], Type.YT_RESULT_VARUINT32, packVarUInt32(faceCount))]
+    for i in range(faceCount):
+        face = [Model.FACE_DETECTION, i]
+        entries.append(packEntry(face, Type.YT_RESULT_RECT,
+            struct.pack('<HHhhhh', 60000, 0, rand.randint(0, 1000), rand.randint(0, 600), 120, 150)))
+        entries.append(packEntry(face + [Model.FACE_LANDMARK], Type.YT_RESULT_POINTS,
+            b''.join(struct.pack('<hh', rand.randint(0, 200), rand.randint(0, 200)) for _ in range(90))))
+        entries.append(packEntry(face + [Model.FACE_POSE], Type.YT_RESULT_ARRAY,
+            struct.pack('<3f', rand.uniform(-30, 30), rand.uniform(-30, 30), rand.uniform(-30, 30))))
+        entries.append(packEntry(face + [Model.FACE_RECOGNITION], Type.YT_RESULT_STRING,
+            struct.pack('<H', 50000) + b'face%d\x00' % i))
+        entries.append(packEntry(face + [Model.DETECTION_TRACE], Type.YT_RESULT_VARUINT32, packVarUInt32(1000 + i)))
+    return bytes([len(entries)]) + b''.join(entries)
+
+def makeResultMsg(frameId, faceCount, rand):
+    msg = YtMsg()
+    msg.result.frameId = frameId
+    msg.result.frameTimestampUs = frameId * 33333
+    msg.result.dataV2 = makeDataV2(faceCount, rand)
+    return msg
+
+def encodeStream(msgs):
+    port = LoopbackPort()
+    datalink = YtDataLink(port)
+    for msg in msgs:
+        datalink.sendYtMsg(msg)
+    return bytes(port.written)
+
+
+def timeit(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        ts = time.perf_counter()
+        fn()
+        cost = time.perf_counter() - ts
+        best = cost if best is None else min(best, cost)
+    return best
+
+def drain(datalinkClass, stream, count):
+    class FramingOnly(datalinkClass):
+        # measure the link layer alone, protobuf decoding is the same for both
+        def parseYtMsg(self, payload):
+            return None, payload
+    datalink = FramingOnly(LoopbackPort(stream))
+    received = 0
+    while received < count:
+        _, msg = datalink.recvRunOnce()
+        if msg:
+            received += 1
+
+def benchDeframer():
+    rand = random.Random(0)
+    print('== deframer: recvRunOnce over synthetic result frames ==')
+    for faceCount, frames in ((1, 200), (10, 50)):
+        stream = encodeStream([makeResultMsg(i, faceCount, rand) for i in range(frames)])
+        legacy = timeit(lambda: drain(LegacyYtDataLink, stream, frames))
+        bulk = timeit(lambda: drain(YtDataLink, stream, frames))
+        print('%2d faces: %7.1f KB, legacy %8.2f ms, bulk %8.2f ms, %5.1fx' % (
+            faceCount, len(stream) / 1024, legacy * 1000, bulk * 1000, legacy / bulk))
+    blob = YtMsg()
+    blob.response.code = blob.response.ReturnCode.SUCC
+    blob.response.filePart.path = '/tmp/blob'
+    blob.response.filePart.totalLength = 512 * 1024
+    blob.response.filePart.offset = 0
+    blob.response.filePart.data = bytes(rand.getrandbits(8) for _ in range(512 * 1024))
+    stream = encodeStream([blob])
+    legacy = timeit(lambda: drain(LegacyYtDataLink, stream, 1), 1)
+    bulk = timeit(lambda: drain(YtDataLink, stream, 1), 1)
+    print('512 KB blob: legacy %8.2f ms, bulk %8.2f ms, %5.1fx' % (legacy * 1000, bulk * 1000, legacy / bulk))
+
+def benchEncoder():
+    rand = random.Random(0)
+    print('== encoder: write() of one sendFile chunk ==')
+    chunk = bytes(rand.getrandbits(8) for _ in range(YtDataLink.fileBlobSize))
+    for datalinkClass in (LegacyYtDataLink, YtDataLink):
+        port = LoopbackPort()
+        datalink = datalinkClass(port)
+        cost = timeit(lambda: datalink.write(chunk))
+        print('%-16s %8.2f ms / %d KB' % (datalinkClass.__name__, cost * 1000, len(chunk) // 1024))
+
+def tableCrc(buf, crc=0xffff):
+    # the per-byte ccittTable update crcUpdate/crcSendUpdate do
+    for ch in buf:
+        crc = YtDataLink.ccittTable[(crc >> 8 ^ ch) & 0xff] ^ ((crc << 8) & 0xffff)
+    return crc
+
+def benchCrc():
+    rand = random.Random(0)
+    print('== crc: crcCcitt vs the per-byte ccittTable update ==')
+    for size in (0, 1, 3, 17, 4096, 65537):
+        buf = bytes(rand.getrandbits(8) for _ in range(size))
+        assert crcCcitt(buf) == tableCrc(buf)
+        assert crcCcitt(bytearray(buf)) == crcCcitt(memoryview(buf)) == tableCrc(buf)
+        # resumed over split chunks, as the deframer feeds partial reads
+        cut = rand.randint(0, size)
+        assert crcCcitt(buf[cut:], crcCcitt(buf[:cut])) == tableCrc(buf)
+        assert crcCcitt(buf[cut:], tableCrc(buf[:cut])) == tableCrc(buf)
+    chunk = bytes(rand.getrandbits(8) for _ in range(YtDataLink.fileBlobSize))
+    table = timeit(lambda: tableCrc(chunk))
+    bulk = timeit(lambda: crcCcitt(chunk))
+    print('bit-for-bit equal; %d KB: table %8.2f ms, crcCcitt %8.3f ms, %5.0fx'
+        % (len(chunk) // 1024, table * 1000, bulk * 1000, table / bulk))
+
+def benchReadSize():
+    rand = random.Random(0)
+    print('== read sizing: port.read() calls to receive 50 frames of 10 faces ==')
+    frames = 50
+    stream = encodeStream([makeResultMsg(i, 10, rand) for i in range(frames)])
+    for maxReadSize in (YtDataLink.minReadSize, 1024, YtDataLink.maxReadSize):
+        port = LoopbackPort(stream)
+        datalink = YtDataLink(port, maxReadSize)
+        received = 0
+        while received < frames:
+            _, msg = datalink.recvRunOnce()
+            if msg:
+                received += 1
+        print('maxReadSize %6d: %6d reads' % (maxReadSize, port.reads))
+
+def readRects(result):
+    Model = YtDataLink.YtVisionSeedModel
+    count = result.getResult([Model.FACE_DETECTION])
+    return [result.getResult([Model.FACE_DETECTION, i]) for i in range(count)]
+
+def benchDataV2():
+    rand = random.Random(0)
+    print('== DataV2: decode 100 frames of 10 faces, then read count + rects ==')
+    frames = [makeDataV2(10, rand) for _ in range(100)]
+    eager = timeit(lambda: [readRects(YtDataLink.DataV2(buf)) for buf in frames])
+    lazy = timeit(lambda: [readRects(YtDataLink.DataV2(buf, True)) for buf in frames])
+    print('eager %8.2f ms, lazy %8.2f ms, %5.1fx' % (eager * 1000, lazy * 1000, eager / lazy))
+
+    print('== DataV2: 5 getResult per face, 10 faces, 100 frames ==')
+    Model = YtDataLink.YtVisionSeedModel
+    results = [YtDataLink.DataV2(buf) for buf in frames]
+    models = (Model.FACE_LANDMARK, Model.FACE_POSE, Model.FACE_RECOGNITION, Model.DETECTION_TRACE)
+    def lookupLists():
+        for result in results:
+            for i in range(10):
+                result.getResult([Model.FACE_DETECTION, i])
+                for model in models:
+                    result.getResult([Model.FACE_DETECTION, i, model])
+    handles = [[YtDataLink.compilePath([Model.FACE_DETECTION, i])] +
+        [YtDataLink.compilePath([Model.FACE_DETECTION, i, model]) for model in models] for i in range(10)]
+    def lookupHandles():
+        for result in results:
+            for faceHandles in handles:
+                for handle in faceHandles:
+                    result.getResult(handle)
+    lists = timeit(lookupLists)
+    compiled = timeit(lookupHandles)
+    print('list paths %8.2f ms, compiled handles %8.2f ms, %5.1fx' % (lists * 1000, compiled * 1000, lists / compiled))
+
+    print('== DataV2: every face output of 100 lazy frames of 10 faces ==')
+    def perFace():
+        for buf in frames:
+            result = YtDataLink.DataV2(buf, True)
+            for i in range(result.getResult([Model.FACE_DETECTION])):
+                result.getResult([Model.FACE_DETECTION, i])
+                for model in models:
+                    result.getResult([Model.FACE_DETECTION, i, model])
+    def columnar():
+        for buf in frames:
+            YtDataLink.DataV2(buf, True).getFaces()
+    objects = timeit(perFace)
+    batch = timeit(columnar)
+    print('getResult objects %8.2f ms, getFaces batch %8.2f ms, %5.1fx' % (objects * 1000, batch * 1000, objects / batch))
+
+def dictResultDecoders():
+    # the built-in decoders over __dict__ carrying result classes with a
+    # per-instance type string, as shipped before __slots__
+    Type = YtDataLink.YtVisionSeedResultType
+    def withDict(base):
+        def __init__(self):
+            base.__init__(self)
+            self.type = base.__name__
+        return type(base.__name__, (base,), {'__init__': __init__})
+    parsePoints = YtDataLink.parseWith(withDict(YtDataLink.YtVisionSeedResultTypePoints))
+    def decodePoints(buf, offset, length):
+        result = parsePoints(buf, offset, length)
+        if len(result.points) == 90:
+            result.faceShape = YtFaceShape(result)
+        return result
+    decoders = YtDataLink.decoders.copy()
+    decoders.register(Type.YT_RESULT_CLASSIFICATION, YtDataLink.parseWith(withDict(YtDataLink.YtVisionSeedResultTypeClassification)), 4)
+    decoders.register(Type.YT_RESULT_RECT, YtDataLink.parseWith(withDict(YtDataLink.YtVisionSeedResultTypeRect)), 12)
+    decoders.register(Type.YT_RESULT_ARRAY, YtDataLink.parseWith(withDict(YtDataLink.YtVisionSeedResultTypeArray)))
+    decoders.register(Type.YT_RESULT_STRING, YtDataLink.parseWith(withDict(YtDataLink.YtVisionSeedResultTypeString)))
+    decoders.register(Type.YT_RESULT_POINTS, decodePoints)
+    return decoders
+
+def frameBytes(frames, decoders=None):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = [YtDataLink.DataV2(buf, False, None, decoders) for buf in frames]
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return used / len(kept)
+
+def benchMemory():
+    rand = random.Random(0)
+    print('== memory: bytes per kept DataV2 frame of 10 faces ==')
+    frames = [makeDataV2(10, rand) for _ in range(100)]
+    decoders = dictResultDecoders()
+    result = YtDataLink.DataV2(frames[0], False, None, decoders).getResult([YtDataLink.YtVisionSeedModel.FACE_DETECTION, 0])
+    assert hasattr(result, '__dict__') and result.type == 'YtVisionSeedResultTypeRect'
+    # the best of a few runs, earlier benchmarks leave the allocator in varying states
+    before = min(frameBytes(frames, decoders) for _ in range(3))
+    after = min(frameBytes(frames) for _ in range(3))
+    print('__dict__ results %8d B/frame, __slots__ results %8d B/frame, %5.1f%% saved' % (
+        before, after, (before - after) / before * 100))
+
+def benchSubscription():
+    rand = random.Random(0)
+    Model = YtDataLink.YtVisionSeedModel
+    print('== subscription: eager DataV2 of 100 frames of 10 faces (51 entries each) ==')
+    frames = [makeDataV2(10, rand) for _ in range(100)]
+    entries = 100 * (1 + 10 * 5)
+    subscription = YtDataLink.Subscription([[Model.FACE_DETECTION], [Model.FACE_DETECTION, None],
+        [Model.FACE_DETECTION, None, Model.DETECTION_TRACE]])
+    everything = timeit(lambda: [YtDataLink.DataV2(buf) for buf in frames])
+    subscribed = timeit(lambda: [YtDataLink.DataV2(buf, False, subscription) for buf in frames])
+    decoded = 100 * (1 + 10 * 2)
+    skipped = entries - decoded
+    # the subscribed run decodes `decoded` entries and skips the rest
+    perDecoded = everything / entries
+    perSkipped = max(0, subscribed - decoded * perDecoded) / skipped
+    print('all entries %8.2f ms, rects + traceIds only %8.2f ms, %5.1fx' % (everything * 1000, subscribed * 1000, everything / subscribed))
+    print('~%.2f us per decoded entry, ~%.2f us per skipped entry' % (perDecoded * 1e6, perSkipped * 1e6))
+
+def benchDecoders():
+    rand = random.Random(0)
+    Model = YtDataLink.YtVisionSeedModel
+    print('== decoders: pose arrays of 100 frames of 10 faces, list vs float32 view ==')
+    frames = [makeDataV2(10, rand) for _ in range(100)]
+    paths = [YtDataLink.compilePath([Model.FACE_DETECTION, i, Model.FACE_POSE]) for i in range(10)]
+    views = YtDataLink.DecoderRegistry.defaults(True)
+    def readPoses(decoders):
+        for buf in frames:
+            result = YtDataLink.DataV2(buf, True, None, decoders)
+            for path in paths:
+                result.getResult(path).array[1]
+    lists = timeit(lambda: readPoses(YtDataLink.decoders))
+    arrays = timeit(lambda: readPoses(views))
+    print('tolist %8.2f ms, zero-copy view %8.2f ms, %5.1fx' % (lists * 1000, arrays * 1000, lists / arrays))
+
+def legacyI420ToBgr(frame, width, height):
+    # example-cocos2d.py before visionseed.video: U and V gathered half-row
+    # by half-row, scaled up with cv2.resize, merged and converted
+    import cv2
+    planes = [frame[:height]]
+    p = height
+    for _ in range(2):
+        plane = []
+        for i in range(p, p + (height >> 2)):
+            plane.append(frame[i][:width >> 1])
+            plane.append(frame[i][width >> 1:width])
+        planes.append(cv2.resize(np.array(plane), (width, height)))
+        p += height >> 2
+    return cv2.cvtColor(cv2.merge(planes), cv2.COLOR_YUV2BGR)
+
+def peakBytes(fn):
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def benchVideo():
+    print('== video: I420 -> BGR per frame ==')
+    try:
+        import cv2
+    except ImportError:
+        cv2 = None
+        print('(cv2 is not installed, the legacy cv2 conversion is skipped)')
+    rng = np.random.default_rng(0)
+    for width, height in ((640, 480), (1280, 720), (1920, 1080)):
+        frame = rng.integers(0, 256, (height * 3 // 2, width), np.uint8)
+        out = np.empty((height, width, 3), np.uint8)
+        line = '%4dx%-4d' % (width, height)
+        if cv2:
+            legacy = timeit(lambda: legacyI420ToBgr(frame, width, height))
+            # same levels, only the chroma interpolation differs, compared on smooth content
+            x = np.arange(width) * 255 // width
+            smooth = np.concatenate([np.add.outer(np.arange(height) * 127 // height, x // 2).astype(np.uint8),
+                np.tile(x[::2].astype(np.uint8), height).reshape(height // 2, width)])
+            diff = np.abs(legacyI420ToBgr(smooth, width, height).astype(int) - video.i420ToBgr(smooth)).max()
+            line += ' legacy cv2 %6.2f ms (max diff %d),' % (legacy * 1000, diff)
+        fresh = timeit(lambda: video.i420ToBgr(frame))
+        reused = timeit(lambda: video.i420ToBgr(frame, out = out))
+        nv12 = timeit(lambda: video.nv12ToBgr(frame, out = out))
+        line += ' i420ToBgr %6.2f ms (%5.1f fps), into out %6.2f ms, %5d KB peak, nv12ToBgr %6.2f ms' % (
+            fresh * 1000, 1 / fresh, reused * 1000, peakBytes(lambda: video.i420ToBgr(frame, out = out)) // 1024, nv12 * 1000)
+        if cv2:
+            # the NumPy fallback i420ToBgr uses without OpenCV
+            size = width * height
+            planes = (frame.reshape(-1)[:size].reshape(height, width),
+                frame.reshape(-1)[size:size + size // 4].reshape(height // 2, width // 2),
+                frame.reshape(-1)[size + size // 4:].reshape(height // 2, width // 2))
+            fallback = timeit(lambda: video.yuvToBgr(*planes, out))
+            diff = np.abs(video.yuvToBgr(*planes, out).astype(int) - video.i420ToBgr(frame)).max()
+            line += ', NumPy fallback %6.2f ms (max diff %d)' % (fallback * 1000, diff)
+        print(line)
+    grey = np.full((6, 4), 128, np.uint8)
+    for level in (16, 128, 235):
+        grey[:4] = level
+        assert video.i420ToBgr(grey)[0, 0].tolist() == [level] * 3
+    print('full range levels kept: Y=16/128/235 -> 16/128/235 (fullRange=False stretches them to 0..255)')
+
+def legacyFrameId(frame, width, height):
+    # the scalar corner read example-cocos2d.py did per frame, with int()
+    # added: NumPy 2 keeps 0 | uint8 a uint8 and the shifts overflow
+    seq = 0
+    seq |= int(frame[0][0])
+    seq <<= 8
+    seq |= int(frame[0][width-1])
+    seq <<= 8
+    seq |= int(frame[height-1][0])
+    seq <<= 8
+    seq |= int(frame[height-1][width-1])
+    return seq
+
+def benchFrameIds():
+    width, height = 1280, 720
+    print('== frameIds: embedded frameId of 256 raw %dx%d frames ==' % (width, height))
+    rng = np.random.default_rng(0)
+    frames = rng.integers(0, 256, (256, height * 3 // 2, width), np.uint8)
+    scalar = timeit(lambda: [legacyFrameId(frame, width, height) for frame in frames])
+    single = timeit(lambda: [video.frameId(frame) for frame in frames])
+    batch = timeit(lambda: video.frameIds(frames))
+    assert [legacyFrameId(frame, width, height) for frame in frames] == video.frameIds(frames)[0].tolist()
+    print('scalar %8.2f ms, frameId per frame %8.2f ms, frameIds batch %8.2f ms, %5.1fx'
+        % (scalar * 1000, single * 1000, batch * 1000, scalar / batch))
+
+def benchRpc():
+    latency = 0.005
+    calls = 64
+    print('== rpc: %d getDeviceInfo calls, %d ms device latency ==' % (calls, latency * 1000))
+    def rpc():
+        ret = YtRpc()
+        ret.func = YtRpc.getDeviceInfo
+        return ret
+    def run(inFlight):
+        port = DevicePort(latency)
+        datalink = YtDataLink(port, maxInFlight=inFlight)
+        datalink.startReader(YtFrameQueue(64, YtFrameQueue.DROP_OLDEST))
+        if inFlight == 1:
+            cost = timeit(lambda: [datalink.sendRpcMsg(rpc()) for _ in range(calls)], 1)
+        else:
+            cost = timeit(lambda: [future.result() for future in [datalink.sendRpcMsgAsync(rpc()) for _ in range(calls)]], 1)
+        datalink.stopReader()
+        port.close()
+        return cost
+    sequential = run(1)
+    line = 'sendRpcMsg one at a time %8.2f ms' % (sequential * 1000)
+    for inFlight in (4, 16):
+        cost = run(inFlight)
+        line += ', %2d in flight %8.2f ms (%4.1fx)' % (inFlight, cost * 1000, sequential / cost)
+    print(line)
+
+
+def applyProfile(target):
+    target.setCamManualExposure(0, 10000, 16)
+    target.setFlasher(1)
+    target.setMainCamId(0)
+    target.setRotation(90)
+    target.setDebugDrawing(1)
+    target.setConfig('profile', '{}')
+
+def benchBatch():
+    latency = 0.005
+    print('== batch: 6 setter RPCs of a device profile, %d ms device latency ==' % (latency * 1000))
+    for readerThread in (False, True):
+        port = DevicePort(latency)
+        vs = YtVisionSeed(port, readerThread=readerThread)
+        sequential = timeit(lambda: applyProfile(vs))
+        def batched():
+            batch = vs.batch()
+            applyProfile(batch)
+            assert batch.send() == [None] * 6
+        pipelined = timeit(batched)
+        print('%-16s one by one %6.2f ms, batch %6.2f ms, %4.1fx'
+            % ('reader thread' if readerThread else 'polling', sequential * 1000, pipelined * 1000, sequential / pipelined))
+        if readerThread:
+            vs.stopReader()
+        port.close()
+
+def benchShadow():
+    latency = 0.002
+    print('== shadow: control loop re-applying 3 settings 50 times, %d ms device latency ==' % (latency * 1000))
+    def controlLoop(vs):
+        for _ in range(50):
+            vs.setCamManualExposure(0, 10000, 16)
+            vs.setFlasher(1)
+            vs.setDebugDrawing(1)
+    costs = []
+    for shadowState in (False, True):
+        port = DevicePort(latency)
+        vs = YtVisionSeed(port, shadowState=shadowState)
+        costs.append(timeit(lambda: controlLoop(vs), 1))
+        port.close()
+    print('every write sent %8.2f ms, unchanged writes skipped %8.2f ms, %5.1fx' % (costs[0] * 1000, costs[1] * 1000, costs[0] / costs[1]))
+
+def benchClient():
+    threads, calls, consumers = 16, 50, 4
+    print('== client: %d threads x %d RPCs and %d stream consumers on one port ==' % (threads, calls, consumers))
+    port = DevicePort(0.002, period=0.002)
+    client = YtVisionSeedClient(port, maxInFlight=threads)
+    errors = []
+    received = []
+    def caller():
+        for i in range(calls):
+            rpc = YtRpc()
+            rpc.func = YtRpc.getDeviceInfo if i % 2 else YtRpc.setDebugDrawing
+            try:
+                resp = client.datalink.sendRpcMsg(rpc)
+                if resp.response.sequenceId != rpc.sequenceId:
+                    errors.append('response %d for request %d' % (resp.response.sequenceId, rpc.sequenceId))
+                elif i % 2 and resp.response.strData != 'VisionSeed %d' % rpc.sequenceId:
+                    errors.append('wrong payload for request %d' % rpc.sequenceId)
+            except Exception as e:
+                errors.append(str(e))
+    def consumer(stream):
+        last = 0
+        count = 0
+        for event in client.results(stream=stream):
+            if isinstance(event, YtVisionSeed.ResultEvent):
+                if event.frameId <= last:
+                    errors.append('frame %d after %d' % (event.frameId, last))
+                last = event.frameId
+                count += 1
+                if event.result is not None:
+                    event.result.getFaces()
+        received.append(count)
+    readers = [threading.Thread(target=consumer, args=(client.openStream(256),)) for _ in range(consumers)]
+    callers = [threading.Thread(target=caller) for _ in range(threads)]
+    ts = time.perf_counter()
+    for thread in readers + callers:
+        thread.start()
+    for thread in callers:
+        thread.join()
+    cost = time.perf_counter() - ts
+    client.close()
+    for thread in readers:
+        thread.join()
+    port.close()
+    print('%d RPCs in %.2f s (%.0f/s), frames per consumer %s, corrupt requests %d, errors %d'
+        % (threads * calls, cost, threads * calls / cost, received, port.corrupt, len(errors)))
+    for error in errors[:5]:
+        print('  ', error)
+    assert not errors, '%d errors' % len(errors)
+    assert port.corrupt == 0, '%d corrupt requests' % port.corrupt
+    assert len(received) == consumers and all(received), 'a consumer got no frames: %s' % received
+
+def serveSocket(port, sock):
+    # bridge a DevicePort to the device end of a socketpair
+    def toPort():
+        for data in iter(lambda: sock.recv(65536), b''):
+            port.write(data)
+    def toSocket():
+        while port.running:
+            data = port.read(1)
+            data += port.read(port.in_waiting)
+            if data:
+                try:
+                    sock.sendall(data)
+                except OSError:
+                    # the host end went away
+                    break
+    threading.Thread(target=toPort, daemon=True).start()
+    threading.Thread(target=toSocket, daemon=True).start()
+
+def benchAsync():
+    calls = 64
+    print('== async: %d concurrent getDeviceInfo over a socketpair while frames stream ==' % calls)
+    async def run(port, sock, **kwargs):
+        vs = await AsyncYtVisionSeed.openConnection(sock=sock, **kwargs)
+        # let the frames pile up first, a full BLOCK queue must not hold the responses back
+        await asyncio.sleep(0.1)
+        ts = time.perf_counter()
+        infos = await asyncio.gather(*[vs.getDeviceInfo() for _ in range(calls)])
+        cost = time.perf_counter() - ts
+        assert sorted(int(info[1]) for info in infos) == list(range(1, calls + 1)), infos
+        last = 0
+        for _ in range(20):
+            result, msg = await vs.recv(1)
+            assert msg is not None and msg.result.frameId > last, msg
+            last = msg.result.frameId
+            assert result.getFaces().count == 2
+        await vs.close()
+        return cost
+    for name, kwargs in (('drop oldest', {}), ('block, queue of 4', {'queueSize': 4, 'overflow': YtFrameQueue.BLOCK})):
+        port = DevicePort(0.005, period=0.005)
+        device, host = socket.socketpair()
+        serveSocket(port, device)
+        cost = asyncio.run(run(port, host, **kwargs))
+        port.close()
+        device.close()
+        assert port.corrupt == 0
+        print('%-18s: %d RPCs in %8.2f ms, responses matched, 20 frames in order, corrupt requests %d' % (name, calls, cost * 1000, port.corrupt))
+
+
+BENCHMARKS = {
+    'deframer': benchDeframer,
+    'encoder': benchEncoder,
+    'crc': benchCrc,
+    'readsize': benchReadSize,
+    'datav2': benchDataV2,
+    'memory': benchMemory,
+    'subscription': benchSubscription,
+    'decoders': benchDecoders,
+    'video': benchVideo,
+    'frameids': benchFrameIds,
+    'rpc': benchRpc,
+    'batch': benchBatch,
+    'shadow': benchShadow,
+    'client': benchClient,
+    'async': benchAsync,
+}
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 # -*- coding:utf-8 -*-
 # author: chenliang @ Youtu Lab, Tencent
-from visionseed import YtVisionSeed, YtDataLink
+from visionseed import YtVisionSeed, YtDataLink, YtFrameJoiner, video
 import serial
+import threading
 
 import cocos
 from cocos import director
@@ -32,12 +33,14 @@ window_height = frame_height
 class VisionSeedLayer(cocos.layer.Layer): #实现一个layer类（图层）
     def __init__(self):
         super(VisionSeedLayer, self).__init__()
-        self.skipSync = 0
-        self.frame = None
-        self.msg = None
+        self.warned = False
+        self.invalidFrames = 0
         self.sprite = None
+        self.joiner = YtFrameJoiner()
 
         vs.setDebugDrawing(1)
+        threading.Thread(target=self.recvFrame, daemon=True).start()
+        threading.Thread(target=self.recvMsg, daemon=True).start()
 
     def drawImage(self, frame, drawRects):
         if (len(drawRects) == 0):
@@ -73,93 +76,43 @@ class VisionSeedLayer(cocos.layer.Layer): #实现一个layer类（图层）
         # cv2.imshow('frame', frame)
         # cv2.waitKey(1)
 
-    def I420ToBgr(self, frame):
-        p = 0
-        len = frame_height
-        Y = frame[p:p+len]
-
-        p += len
-        len = frame_height>>2
-        U = []
-        for i in range(p, p+len):
-            U.append( frame[i][:frame_width>>1] )
-            U.append( frame[i][frame_width>>1:frame_width] )
-        U = np.array(U)
-        U = cv2.resize(U, (frame_width, frame_height))
-
-
-        p += len
-        V = []
-        for i in range(p, p+len):
-            V.append( frame[i][:frame_width>>1] )
-            V.append( frame[i][frame_width>>1:frame_width] )
-        V = np.array(V)
-        V = cv2.resize(V, (frame_width, frame_height))
-
-        YUV = cv2.merge([Y, U, V])
-        dst = cv2.cvtColor(YUV, cv2.COLOR_YUV2BGR)
-        return dst
-
     def recvMsg(self):
-        while True:
-            result, msg = vs.recvRunOnce()
-            if msg:
-                # print(msg)
-                if msg.result.HasField('frameId'):
-                    self.msg = {'msg':msg, 'result':result, 'frameId':msg.result.frameId}
-                    break
-                elif msg.result.HasField('systemStatusResult'):
-                    #print(msg)
-                    pass
+        # 结果线程: 把带 frameId 的结果交给 joiner, 不会阻塞视频线程
+        for event in vs.results():
+            if isinstance(event, YtVisionSeed.ResultEvent) and event.msg.result.HasField('frameId'):
+                self.joiner.putResult(event.frameId, event.result)
+
     def recvFrame(self):
-        ret, frame = cap.read()
-        if ret == True:
-            # On Windows, cv2 give us a 1-D array
-            if frame.shape[0] == 1:
-                frame = np.reshape(frame, (-1, frame_width))
-            seq = 0
-            seq |= frame[0][0]
-            seq <<= 8
-            seq |= frame[0][frame_width-1]
-            seq <<= 8
-            seq |= frame[frame_height-1][0]
-            seq <<= 8
-            seq |= frame[frame_height-1][frame_width-1]
-            # print('seq =', seq)
-
-            bgr = self.I420ToBgr(frame)
-            self.frame = {'frame':bgr, 'frameId':seq}
+        # 视频线程
+        previous = None
+        while True:
+            ret, frame = cap.read()
+            if ret == True:
+                # On Windows, cv2 give us a 1-D array
+                if frame.shape[0] == 1:
+                    frame = np.reshape(frame, (-1, frame_width))
+                # 先取 frameId, 配对成功后再转换颜色; 跳过与上一帧不连续的 frameId (读错、旧固件)
+                ids, valid = video.frameIds(frame, frame_width, frame_height, previous)
+                previous = int(ids[0])
+                if valid[0]:
+                    self.joiner.putVideo(previous, frame)
+                else:
+                    self.invalidFrames += 1
 
     def callback(self, dt):
         #print('%f seconds since last callback' % dt)
 
-        # 根据frameId同步
-        while self.msg == None:
-            self.recvMsg()
-        while self.frame == None:
-            self.recvFrame()
-        if abs(self.frame['frameId'] - self.msg['frameId']) > 3600:
-            self.skipSync += 1
-            if (self.skipSync >= 10):
-                print('Your VisionSeed may running old firmware! %d != %d' % (self.frame['frameId'], self.msg['frameId']))
-            self.msg = None
-            self.frame = None
+        # 根据frameId同步, 只取已配对的帧, 不等待
+        pair = self.joiner.get(0)
+        if pair is None:
+            unmatched = self.joiner.video.unmatched + self.joiner.results.unmatched
+            if self.joiner.matched == 0 and unmatched + self.invalidFrames >= 10 and not self.warned:
+                self.warned = True
+                print('Your VisionSeed may running old firmware! video frames never match a result frameId')
             return
-
-        while self.frame['frameId'] > self.msg['frameId']:
-            # print('seq =', self.frame['frameId'], self.msg['frameId'])
-            self.recvMsg()
-        while self.frame['frameId'] < self.msg['frameId']:
-            # print('seq =', self.frame['frameId'], self.msg['frameId'])
-            self.recvFrame()
-        if self.frame['frameId'] != self.msg['frameId']:
-            print('miss =', self.frame['frameId'], self.msg['frameId'])
-            return
-
-        self.on_frame(self.frame['frame'], self.msg['result'])
-
-        self.msg = None
-        self.frame = None
+        frameId, frame, result = pair
+        if result:
+            self.on_frame(video.i420ToBgr(frame, frame_width, frame_height), result)
 
     def on_enter( self ):
         super(VisionSeedLayer,self).on_enter()
@@ -8,10 +8,11 @@ import time
 vs = YtVisionSeed( serial.Serial("/dev/ttyACM0",115200,timeout=0.5) )
 
 def main():
-    while True:
-        result, msg = vs.recvRunOnce()
+    # 阻塞等待下一条消息, 不再轮询 recvRunOnce
+    for event in vs.results():
+        result = event.result
 
-        if result:
+        if isinstance(event, YtVisionSeed.ResultEvent) and result:
             YtVisionSeedModel = YtDataLink.YtVisionSeedModel
             count = result.getResult([YtVisionSeedModel.FACE_DETECTION])
             for i in range(count):
@@ -11,10 +11,23 @@
 from .YtMsg_pb2 import *
 from .FilePart_pb2 import *
 from . import YtFaceAlignment
+from .YtRpcEngine import YtRpcEngine
+from .YtFrameQueue import YtFrameQueue
 import numpy as np
+import binascii
+import collections
 import struct
+import threading
 import time
 
+def crcCcitt (buf, crc = 0xffff):
+    '''
+    CRC-CCITT (poly 0x1021) of a whole bytes/bytearray/memoryview, the same
+    value the per-byte YtDataLink.ccittTable update yields. Pass the
+    returned value back as crc to resume over the next chunk.
+    '''
+    return binascii.crc_hqx(buf, crc)
+
 class YtDataLink:
     class YtVisionSeedResultType:
         YT_RESULT_RECT = 0
@@ -30,25 +43,30 @@ class YtDataLink:
         def __setattr__(self, attr, value):
             self[attr] = value
 
+    # Result types keep their fields in __slots__ and the type name on the
+    # class, so an instance carries no __dict__.
     class YtVisionSeedResultTypeConfidence:
+        __slots__ = ('conf',)
+        type = 'YtVisionSeedResultTypeConfidence'
         def __init__ (self):
-            self.type = 'YtVisionSeedResultTypeConfidence'
             self.conf = 0
         def parse (self, bufObj, count):
             conf = YtDataLink.unpackUInt16(bufObj)
             self.conf = conf / 65535
     class YtVisionSeedResultTypeClassification(YtVisionSeedResultTypeConfidence):
+        __slots__ = ('cls',)
+        type = 'YtVisionSeedResultTypeClassification'
         def __init__ (self):
             super().__init__()
-            self.type = 'YtVisionSeedResultTypeClassification'
             self.cls = 0
         def parse (self, bufObj, count):
             super().parse(bufObj, count)
             self.cls = YtDataLink.unpackUInt16(bufObj)
     class YtVisionSeedResultTypeRect(YtVisionSeedResultTypeClassification):
+        __slots__ = ('x', 'y', 'w', 'h')
+        type = 'YtVisionSeedResultTypeRect'
         def __init__ (self):
             super().__init__()
-            self.type = 'YtVisionSeedResultTypeRect'
             self.x = 0
             self.y = 0
             self.w = 0
@@ -61,8 +79,9 @@ class YtDataLink:
             self.h = YtDataLink.unpackInt16(bufObj)
 
     class YtVisionSeedResultTypeArray:
+        __slots__ = ('array',)
+        type = 'YtVisionSeedResultTypeArray'
         def __init__ (self):
-            self.type = 'YtVisionSeedResultTypeArray'
             self.array = []
 
         def parse (self, bufObj, count):
@@ -73,9 +92,10 @@ class YtDataLink:
             bufObj.i += count
 
     class YtVisionSeedResultTypeString(YtVisionSeedResultTypeConfidence):
+        __slots__ = ('str',)
+        type = 'YtVisionSeedResultTypeString'
         def __init__ (self):
             super().__init__()
-            self.type = 'YtVisionSeedResultTypeString'
             self.str = ''
 
         def parse (self, bufObj, count):
@@ -88,16 +108,17 @@ class YtDataLink:
             self.str = str(cur_data, encoding = "utf-8")
 
     class YtVisionSeedResultTypePoints:
+        __slots__ = ('points', 'faceShape')
+        type = 'YtVisionSeedResultTypePoints'
         def __init__ (self):
-            self.type = 'YtVisionSeedResultTypePoints'
-            self.points = []
+            self.points = YtFaceAlignment.Points(np.zeros((0, 2), np.int16))
 
         def parse (self, bufObj, count):
-            for i in range(count // 4):
-                self.points.append(YtDataLink.AttributeDict({
-                    'x': YtDataLink.unpackInt16(bufObj),
-                    'y': YtDataLink.unpackInt16(bufObj),
-                }))
+            # read-only (count/4, 2) int16 view over the payload, no per-point objects
+            points = np.frombuffer(bufObj.p, '<i2', (count // 4) * 2, bufObj.i).reshape(-1, 2)
+            points.flags.writeable = False
+            self.points = YtFaceAlignment.Points(points)
+            bufObj.i += (count // 4) * 4
 
     class YtVisionSeedModel:
         FACE_DETECTION = 1
@@ -107,57 +128,230 @@ class YtDataLink:
         FACE_RECOGNITION = 6
         DETECTION_TRACE = 8
 
+    class Subscription:
+        '''
+        The result paths an application consumes. Each pattern is a path
+        such as [FACE_DETECTION, None, DETECTION_TRACE] where None matches
+        any single model/index number; entries matching no pattern are
+        skipped by length without being decoded.
+        '''
+        def __init__(self, patterns):
+            self.exact = set()
+            self.wildcards = []
+            for pattern in patterns:
+                pattern = tuple(pattern)
+                if None in pattern:
+                    self.wildcards.append(pattern)
+                else:
+                    self.exact.add(YtDataLink.compilePath(pattern))
+            # the same paths repeat in every frame, remember each verdict
+            self.cache = {}
+
+        def match(self, path):
+            ret = self.cache.get(path)
+            if (ret is None):
+                ret = path in self.exact or any(len(pattern) == len(path) and
+                    all(p is None or p == x for p, x in zip(pattern, path)) for pattern in self.wildcards)
+                self.cache[path] = ret
+            return ret
+
+    class DecoderRegistry:
+        '''
+        Maps a YtVisionSeedResultType and payload length to the decoder of an
+        entry, a callable decoder(buf, offset, length) returning the result.
+        Entries no decoder accepts are returned as raw byte slices.
+        '''
+        def __init__(self):
+            self.decoders = {}
+
+        def register(self, type, decoder, length = None, minLength = 0, maxLength = None):
+            '''
+            Decode entries of type whose length is exactly length, or within
+            [minLength, maxLength] (None is unbounded). The latest registration
+            accepting an entry wins, so applications can override built-ins.
+            '''
+            if not (length is None):
+                minLength = maxLength = length
+            self.decoders.setdefault(type, []).insert(0, (minLength, maxLength, decoder))
+
+        def lookup(self, type, length):
+            for minLength, maxLength, decoder in self.decoders.get(type, ()):
+                if (minLength <= length and (maxLength is None or length <= maxLength)):
+                    return decoder
+            return None
+
+        def copy(self):
+            ret = YtDataLink.DecoderRegistry()
+            ret.decoders = {type: list(entries) for type, entries in self.decoders.items()}
+            return ret
+
+        @staticmethod
+        def defaults(arrayViews = False):
+            # the built-in result types, what DataV2 has always decoded
+            Type = YtDataLink.YtVisionSeedResultType
+            ret = YtDataLink.DecoderRegistry()
+            ret.register(Type.YT_RESULT_CLASSIFICATION, YtDataLink.parseWith(YtDataLink.YtVisionSeedResultTypeClassification), 4)
+            ret.register(Type.YT_RESULT_RECT, YtDataLink.parseWith(YtDataLink.YtVisionSeedResultTypeRect), 12)
+            if (arrayViews):
+                ret.register(Type.YT_RESULT_ARRAY, YtDataLink.decodeArrayView)
+            else:
+                ret.register(Type.YT_RESULT_ARRAY, YtDataLink.parseWith(YtDataLink.YtVisionSeedResultTypeArray))
+            ret.register(Type.YT_RESULT_STRING, YtDataLink.parseWith(YtDataLink.YtVisionSeedResultTypeString))
+            ret.register(Type.YT_RESULT_POINTS, YtDataLink.decodePoints)
+            ret.register(Type.YT_RESULT_VARUINT32, YtDataLink.decodeVarUInt32)
+            return ret
+
+    def parseWith (resultClass):
+        # decoder building a resultClass instance through its parse()
+        def decoder(buf, offset, length):
+            result = resultClass()
+            result.parse(YtDataLink.AttributeDict({'p': buf, 'i': offset}), length)
+            return result
+        return decoder
+
+    def decodeArrayView (buf, offset, length):
+        # the float32 array as a read-only view over the payload instead of a list
+        result = YtDataLink.YtVisionSeedResultTypeArray()
+        array = np.frombuffer(buf, '<f4', length // 4, offset)
+        array.flags.writeable = False
+        result.array = array
+        return result
+
+    def decodePoints (buf, offset, length):
+        result = YtDataLink.parseWith(YtDataLink.YtVisionSeedResultTypePoints)(buf, offset, length)
+        if (len(result.points) == 90):
+            result.faceShape = YtFaceAlignment.YtFaceShape(result)
+        return result
+
+    def decodeVarUInt32 (buf, offset, length):
+        return YtDataLink.scanVarUInt(buf, offset)[0]
+
     class DataV2:
-        def __init__(self, buf):
+        def __init__(self, buf, lazy = False, subscription = None, decoders = None):
+            '''
+            With lazy=True only the (type, offset, length) of every entry is
+            recorded here, getResult decodes an entry the first time it is
+            asked for, so a frame costs roughly what the consumer reads.
+            With a Subscription, entries it does not match are skipped.
+            Entries are decoded by decoders (YtDataLink.decoders by default).
+            '''
             # self.array = bytearray(0)
+            self.buf = buf
+            self.decoders = YtDataLink.decoders if decoders is None else decoders
             self.data = {}
-            bufObj = YtDataLink.AttributeDict({'p': buf, 'i': 0})
-            count = bufObj.p[bufObj.i]
-            bufObj.i += 1
-            for i in range(count):
-                cur_path_len = bufObj.p[bufObj.i]
-                bufObj.i += 1
-                cur_path = bufObj.p[bufObj.i : bufObj.i + cur_path_len]
-                bufObj.i += cur_path_len
-                type = bufObj.p[bufObj.i]
-                bufObj.i += 1
-                cur_data_len = YtDataLink.unpackVarUInt32(bufObj)
-
-                result = None
-                if (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_CLASSIFICATION and cur_data_len == 4):
-                    result = YtDataLink.YtVisionSeedResultTypeClassification()
-                elif (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_RECT and cur_data_len == 12):
-                    result = YtDataLink.YtVisionSeedResultTypeRect()
-                elif (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_ARRAY):
-                    result = YtDataLink.YtVisionSeedResultTypeArray()
-                elif (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_STRING):
-                    result = YtDataLink.YtVisionSeedResultTypeString()
-                elif (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_POINTS):
-                    result = YtDataLink.YtVisionSeedResultTypePoints()
-                elif (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_VARUINT32):
-                    result = YtDataLink.unpackVarUInt32(bufObj)
-
-                cur_path = ','.join([str(int.from_bytes(cur_path[x:x+1], byteorder='little', signed=False)) for x in range(len(cur_path))])
-                if not (result is None):
-                    if hasattr(result, 'parse'):
-                        result.parse(bufObj, cur_data_len)
-
-                    if (type == YtDataLink.YtVisionSeedResultType.YT_RESULT_POINTS and len(result.points) == 90):
-                        result.faceShape = YtFaceAlignment.YtFaceShape(result)
-
-                    self.data[cur_path] = result
-                else:
-                    cur_data = bufObj.p[bufObj.i : bufObj.i + cur_data_len]
-                    self.data[cur_path] = cur_data
-                    bufObj.i += cur_data_len
+            self.index = {}
+            scanVarUInt = YtDataLink.scanVarUInt
+            count = buf[0]
+            i = 1
+            for _ in range(count):
+                cur_path_len = buf[i]
+                # paths are keyed by the tuple of their model/index bytes
+                cur_path = tuple(buf[i + 1 : i + 1 + cur_path_len])
+                i += 1 + cur_path_len
+                type = buf[i]
+                cur_data_len, i = scanVarUInt(buf, i + 1)
+
+                if (subscription is None or subscription.match(cur_path)):
+                    self.index[cur_path] = (type, i, cur_data_len)
+                    if not (lazy):
+                        self.data[cur_path] = self.decode(type, i, cur_data_len)
+                i += cur_data_len
             # // console.log('[result]', self.data)
 
+        def decode(self, type, offset, cur_data_len):
+            decoder = self.decoders.lookup(type, cur_data_len)
+            if (decoder is None):
+                return self.buf[offset : offset + cur_data_len]
+            return decoder(self.buf, offset, cur_data_len)
+
         def getResult(self, path):
-            path = ','.join(str(x) for x in path)
+            # path is a list of model/index numbers or a handle from YtDataLink.compilePath
+            if path.__class__ is not tuple:
+                path = tuple(path)
             if path in self.data:
                 return self.data[path]
+            if path in self.index:
+                result = self.decode(*self.index[path])
+                self.data[path] = result
+                return result
             return None
 
+        def keep(self):
+            '''
+            Copy the payload out of the link's reusable receive buffer (if the
+            frame was built on a view of it) so the frame stays valid after
+            the next message arrives. Returns self.
+            '''
+            if not isinstance(self.buf, bytes):
+                self.buf = bytes(self.buf)
+                self.data = {path: self.decode(*self.index[path]) for path in self.data}
+            return self
+
+        def getFaces(self):
+            '''
+            All faces of the frame as a columnar FaceBatch, read straight from
+            the entry index without building per-face result objects.
+            '''
+            Model = YtDataLink.YtVisionSeedModel
+            Type = YtDataLink.YtVisionSeedResultType
+            count = self.getResult([Model.FACE_DETECTION])
+            faces = YtDataLink.FaceBatch(count if isinstance(count, int) else 0)
+            buf = self.buf
+            index = self.index
+            for i in range(faces.count):
+                entry = index.get((Model.FACE_DETECTION, i))
+                if entry and entry[0] == Type.YT_RESULT_RECT and entry[2] == 12:
+                    conf, _, x, y, w, h = struct.unpack_from('<HHhhhh', buf, entry[1])
+                    faces.confidences[i] = conf / 65535
+                    faces.rects[i] = (x, y, w, h)
+                entry = index.get((Model.FACE_DETECTION, i, Model.DETECTION_TRACE))
+                if entry and entry[0] == Type.YT_RESULT_VARUINT32:
+                    faces.traceIds[i] = YtDataLink.unpackVarUInt32(YtDataLink.AttributeDict({'p': buf, 'i': entry[1]}))
+                entry = index.get((Model.FACE_DETECTION, i, Model.FACE_POSE))
+                if entry and entry[0] == Type.YT_RESULT_ARRAY and entry[2] >= 12:
+                    faces.poses[i] = np.frombuffer(buf, '<f4', 3, entry[1])
+                entry = index.get((Model.FACE_DETECTION, i, Model.FACE_RECOGNITION))
+                if entry and entry[0] == Type.YT_RESULT_STRING and entry[2] >= 3:
+                    faces.nameConfidences[i] = struct.unpack_from('<H', buf, entry[1])[0] / 65535
+                    faces.names[i] = str(buf[entry[1] + 2 : entry[1] + entry[2] - 1], encoding = "utf-8")
+                entry = index.get((Model.FACE_DETECTION, i, Model.FACE_LANDMARK))
+                if entry and entry[0] == Type.YT_RESULT_POINTS and entry[2] == 360:
+                    faces.landmarks[i] = np.frombuffer(buf, '<i2', 180, entry[1]).reshape(90, 2)
+                    faces.hasLandmarks[i] = True
+            return faces
+
+    class FaceBatch:
+        '''
+        Columnar view of the faces of one frame, row i is face i. Missing
+        outputs are -1 (traceIds), NaN (confidences, poses), None (names) or
+        False in hasLandmarks.
+        '''
+        def __init__(self, count):
+            self.count = count
+            self.rects = np.zeros((count, 4), np.int16)           # x, y, w, h
+            self.confidences = np.full(count, np.nan, np.float32)
+            self.traceIds = np.full(count, -1, np.int64)
+            self.poses = np.full((count, 3), np.nan, np.float32)   # roll, yaw, pitch
+            self.names = [None] * count
+            self.nameConfidences = np.full(count, np.nan, np.float32)
+            self.landmarks = np.zeros((count, 90, 2), np.int16)
+            self.hasLandmarks = np.zeros(count, bool)
+
+        def __len__(self):
+            return self.count
+
+        def getFaceShapes(self):
+            # every face's landmarks as one stacked (N, 90, 2) YtFaceShape
+            return YtFaceAlignment.YtFaceShape(self.landmarks)
+
+    @staticmethod
+    def compilePath(path):
+        '''
+        Precompile a result path, e.g. [FACE_DETECTION, i, FACE_LANDMARK], into
+        a handle getResult looks up without converting the path again.
+        '''
+        return tuple(int(x) for x in path)
+
     class YtDataLinkStatus:
         YT_DL_IDLE = 0
         YT_DL_LEN1_PENDING = 1
@@ -172,6 +366,8 @@ class YtDataLink:
     TRANS = 0x11
     ytMsgSize = 2097152
     fileBlobSize = 131072
+    minReadSize = 16
+    maxReadSize = 65536
     ccittTable = [
         0x0000, 0x1021, 0x2042, 0x3063, 0x4084, 0x50A5, 0x60C6, 0x70E7,
         0x8108, 0x9129, 0xA14A, 0xB16B, 0xC18C, 0xD1AD, 0xE1CE, 0xF1EF,
@@ -207,17 +403,148 @@ class YtDataLink:
         0x6E17, 0x7E36, 0x4E55, 0x5E74, 0x2E93, 0x3EB2, 0x0ED1, 0x1EF0
     ]
 
-    def __init__(self, port):
-        self.array = bytearray(0)
-        self.cursor = 0
-        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
-        self.mMsgLen = 0
-        self.mCrc = 0
+    class YtDeframer:
+        '''
+        Bulk decoder of the YtDataLink framing. Raw bytes from the port are
+        fed in with feed(), next() returns the payload of the next complete
+        frame whose CRCs check out. SOF/TRANS markers are located with
+        bytearray.find/split, so the payload is unescaped a slice at a time
+        instead of one byte per loop iteration.
+
+        Frames are unescaped into one receive buffer that is reused for every
+        frame and only reallocated when a larger frame arrives. next() returns
+        a memoryview into it, valid until the following call to next().
+        '''
+        def __init__(self, bufSize = 4096):
+            self.array = bytearray(0)
+            self.cursor = 0
+            self.mStatus = YtDataLink.YtDataLinkStatus.YT_DL_IDLE
+            self.mMsgLen = 0
+            self.mTrans = False
+            self.mBuf = bytearray(bufSize)
+            self.mBufi = 0
+
+        def feed(self, buf):
+            if self.cursor > 0 and self.cursor * 2 >= len(self.array):
+                del self.array[:self.cursor]
+                self.cursor = 0
+            self.array += buf
+
+        def pending(self):
+            # raw bytes received but not scanned yet
+            return len(self.array) - self.cursor
+
+        def needed(self):
+            # unescaped bytes still missing to complete the current frame
+            if self.mStatus == YtDataLink.YtDataLinkStatus.YT_DL_DATA:
+                return 5 + self.mMsgLen + 2 - self.mBufi
+            return 0
+
+        def append(self, part):
+            end = self.mBufi + len(part)
+            if (end > len(self.mBuf)):
+                # views of earlier frames may still be alive, so grow into a new
+                # buffer instead of resizing the exported one
+                buf = bytearray(max(end, len(self.mBuf) * 2))
+                buf[0 : self.mBufi] = memoryview(self.mBuf)[0 : self.mBufi]
+                self.mBuf = buf
+            self.mBuf[self.mBufi : end] = part
+            self.mBufi = end
+
+        def unescape(self, start, stop):
+            if start >= stop:
+                return
+            trans = self.mTrans
+            # //转义后，不会出现SOF, TRANS; every part after a TRANS starts with an escaped byte
+            for i, part in enumerate(self.array[start:stop].split(b'\x11')):
+                if i > 0:
+                    trans = True
+                if part:
+                    if trans:
+                        part[0] ^= YtDataLink.TRANS
+                    self.append(part)
+                    trans = False
+            self.mTrans = trans
+
+        def next(self):
+            Status = YtDataLink.YtDataLinkStatus
+            array = self.array
+            while True:
+                if self.mStatus == Status.YT_DL_IDLE:
+                    start = array.find(YtDataLink.SOF, self.cursor)
+                    if start < 0:
+                        self.cursor = len(array)
+                        return None
+                    self.cursor = start + 1
+                    self.mStatus = Status.YT_DL_LEN1_PENDING
+                    self.mMsgLen = 0
+                    self.mTrans = False
+                    self.mBufi = 0
+
+                end = array.find(YtDataLink.SOF, self.cursor)
+                stop = len(array) if end < 0 else end
+                self.unescape(self.cursor, stop)
+                self.cursor = stop
+                buf = self.mBuf
+
+                if self.mStatus == Status.YT_DL_LEN1_PENDING and self.mBufi >= 5:
+                    self.mMsgLen = (buf[0] << 16) | (buf[1] << 8) | buf[2]
+                    crc = (buf[3] << 8) | buf[4]
+                    crcCalc = crcCcitt(memoryview(buf)[0:3])
+                    if (crcCalc != crc):
+                        print('[YtMsg] Error: msg len crc 0x%04x != 0x%04x' % (crcCalc, crc))
+                        self.mStatus = Status.YT_DL_IDLE
+                        continue
+                    if (self.mMsgLen > YtDataLink.ytMsgSize):
+                        # console.log('[YtMsg] Error: msg len %d > %d\n', self.mMsgLen, ytMsgSize)
+                        self.mStatus = Status.YT_DL_IDLE
+                        continue
+                    self.mStatus = Status.YT_DL_DATA
+
+                if self.mStatus == Status.YT_DL_DATA and self.mBufi >= 5 + self.mMsgLen + 2:
+                    self.mStatus = Status.YT_DL_IDLE
+                    payload = memoryview(buf)[5 : 5 + self.mMsgLen]
+                    crc = (buf[5 + self.mMsgLen] << 8) | buf[5 + self.mMsgLen + 1]
+                    crcCalc = crcCcitt(payload)
+                    if (crcCalc != crc):
+                        print('[YtMsg] Error: msg crc 0x%04x != 0x%04x' % (crcCalc, crc))
+                        continue
+                    return payload
+
+                if end < 0:
+                    return None
+                # a new SOF arrived before the current frame was complete
+                print('[YtMsg] unfinished pkg(%d/%d)' % (max(0, self.mBufi - 5), self.mMsgLen))
+                self.mStatus = Status.YT_DL_IDLE
+
+    def __init__(self, port, maxReadSize = None, lazyResults = False, fastResults = True, arrayViews = False, maxInFlight = 8, holdFrames = 64, borrowResults = False, decoders = None):
+        self.deframer = YtDataLink.YtDeframer()
+        # shared with every link unless given its own registry, arrayViews
+        # keeps the registrations and only swaps the array decoder
+        decoders = YtDataLink.decoders if decoders is None else decoders
+        if (arrayViews):
+            decoders = decoders.copy()
+            decoders.register(YtDataLink.YtVisionSeedResultType.YT_RESULT_ARRAY, YtDataLink.decodeArrayView)
+        self.decoders = decoders
+        self.lazyResults = lazyResults
+        self.fastResults = fastResults
+        # fast path DataV2 on the receive buffer itself, valid until the next message
+        self.borrowResults = borrowResults
+        self.subscription = None
+        if not (maxReadSize is None):
+            self.maxReadSize = maxReadSize
         self.mCrcCalc = 0xffff
-        self.mTrans = False
         self.mCrcSendCalc = 0xffff
         self.port = port
         self.rpcId = 0
+        self.rpcLock = threading.Lock()
+        self.writeLock = threading.Lock()
+        self.rpcEngine = YtRpcEngine(self, maxInFlight)
+        # messages a polling sendRpcMsg read past, recvRunOnce returns them first
+        self.heldFrames = YtFrameQueue(holdFrames, YtFrameQueue.DROP_OLDEST)
+        self.reader = None
+        self.readerRunning = False
+        self.frameQueue = None
         self.port.read(1)
 
     def crcUpdate (self, ch, first):
@@ -231,105 +558,133 @@ class YtDataLink:
     def printBuf (self, buf):
         print(''.join('{:02x} '.format(x) for x in buf))
 
-    def recvRunOnce(self):
-        if len(self.array) < 10:
-            buf = self.port.read(16)
-            self.array += buf
-        while len(self.array) > 0:
-            ch = self.array.pop(0)
-            # print('loop=', self.toHex(ch))
-            if (ch == self.SOF):
-                if (self.mStatus != self.YtDataLinkStatus.YT_DL_IDLE):
-                    print('[YtMsg] unfinished pkg(%d/%d)', self.mBufi, self.mMsgLen)
-
-                self.mStatus = self.YtDataLinkStatus.YT_DL_LEN1_PENDING
-            elif (ch == self.TRANS):
-                self.mTrans = True
+    def subscribe (self, patterns):
+        '''
+        Only index and decode the result paths matching patterns (see
+        Subscription); None subscribes to everything again.
+        '''
+        self.subscription = None if patterns is None else YtDataLink.Subscription(patterns)
+
+    def scanResult (self, payload):
+        '''
+        Fast path for plain result frames: walk the protobuf wire format just
+        far enough to find YtMsg.result and its frameId, frameTimestampUs and
+        dataV2 fields. Returns None whenever anything else is in the message
+        (RPCs, responses, status, legacy results), which then gets the full
+        YtMsg parse.
+        '''
+        # YtMsg.result is field 3, length delimited, and must span the payload
+        if (len(payload) < 2 or payload[0] != (3 << 3 | 2)):
+            return None
+        end, i = YtDataLink.scanVarUInt(payload, 1)
+        end += i
+        if (end != len(payload)):
+            return None
+        fields = {}
+        while (i < end):
+            tag, i = YtDataLink.scanVarUInt(payload, i)
+            if (tag == (1 << 3 | 0) or tag == (2 << 3 | 0)):
+                fields[tag >> 3], i = YtDataLink.scanVarUInt(payload, i)
+            elif (tag == (101 << 3 | 2)):
+                length, i = YtDataLink.scanVarUInt(payload, i)
+                fields[101] = (i, i + length)
+                i += length
             else:
-                # //转义后，不会出现SOF, TRANS
-                if (self.mTrans):
-                    ch = ch ^ self.TRANS
-                    self.mTrans = False
-
-                # if (self.mStatus == self.YtDataLinkStatus.YT_DL_IDLE):
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING):
-                    # print('[YtMsg] begin\n')
-                    self.mStatus = self.YtDataLinkStatus.YT_DL_LEN1_PENDING
-                    self.mMsgLen = 0
-                    self.mCrc = 0
-                    # //falls through
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING or
-                    self.mStatus == self.YtDataLinkStatus.YT_DL_LEN2_PENDING or
-                    self.mStatus == self.YtDataLinkStatus.YT_DL_LEN3_PENDING):
-                    # // console.log('[YtMsg]', self.toHex(ch))
-                    self.crcUpdate(ch, self.mStatus == self.YtDataLinkStatus.YT_DL_LEN1_PENDING)
-                    self.mMsgLen = (self.mMsgLen << 8) | ch
-                    if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN3_PENDING):
-                        # print('len=', self.mMsgLen)
-                        if (self.mMsgLen > self.ytMsgSize):
-                            # console.log('[YtMsg] Error: msg len %d > %d\n', self.mMsgLen, ytMsgSize)
-                            self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
-                            continue
-
-                    self.mStatus = self.mStatus + 1
-                    continue
-
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN_CRC_H):
-                    self.mCrc = (self.mCrc << 8) | ch
-                    self.mStatus = self.mStatus + 1
-                    continue
-
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_LEN_CRC_L):
-                    self.mCrc = (self.mCrc << 8) | ch
-                    if ((self.mCrcCalc) != self.mCrc):
-                        print('[YtMsg] Error: msg len crc 0x%04x != 0x%04x\n', self.toHex(self.mCrcCalc), self.toHex(self.mCrc))
-                        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
-                        continue
+                return None
+
+        target = YtMsg()
+        target.result.SetInParent()
+        if (1 in fields):
+            target.result.frameId = fields[1]
+        if (2 in fields):
+            target.result.frameTimestampUs = fields[2]
+        dataV2 = None
+        if (101 in fields):
+            start, stop = fields[101]
+            # the payload is a view of the deframer's reusable buffer
+            buf = payload[start : stop] if self.borrowResults else bytes(payload[start : stop])
+            dataV2 = YtDataLink.DataV2(buf, self.lazyResults, self.subscription, self.decoders)
+        return dataV2, target
+
+    def scanVarUInt (buf, i):
+        # protobuf varint at buf[i], returns (value, index after it)
+        ret = 0
+        shift = 0
+        while (True):
+            byte = buf[i]
+            i += 1
+            ret |= (byte & 0x7f) << shift
+            if ((byte & 0x80) == 0):
+                return ret, i
+            shift += 7
 
-                    self.mStatus = self.mStatus + 1
-                    self.mBuf = bytearray(self.mMsgLen)
-                    self.mBufi = 0
+    def parseYtMsg (self, payload, full = False):
+        '''
+        Decode one frame payload into (DataV2, YtMsg). Unless full is set or
+        fastResults is off, result frames skip the YtMsg parse: their msg
+        only carries result.frameId/frameTimestampUs, not the raw
+        result.dataV2 bytes. The DataV2 gets a copy of its slice of the
+        payload, or with borrowResults the slice itself (see DataV2.keep).
+        '''
+        if (self.fastResults and not full):
+            ret = self.scanResult(payload)
+            if not (ret is None):
+                return ret
+        target = YtMsg()
+        dataV2 = None
+        target.ParseFromString(payload)
+        if target.result.HasField('dataV2'):
+            dataV2 = YtDataLink.DataV2(target.result.dataV2, self.lazyResults, self.subscription, self.decoders)
+        return dataV2, target
+
+    def readPort (self, size):
+        # Read at least size bytes (blocking up to the port timeout), grown to
+        # whatever is already pending on the port, bounded by maxReadSize, so
+        # one syscall drains the OS buffer at any baud rate.
+        waiting = getattr(self.port, 'in_waiting', 0)
+        size = max(size, min(waiting, self.maxReadSize))
+        self.deframer.feed(self.port.read(size))
 
-                    # Brust read
-                    # print('[YtMsg] Brust read', self.mMsgLen)
-                    self.array += self.port.read(self.mMsgLen)
-                    continue
-
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_DATA):
-                    self.crcUpdate(ch, self.mBufi == 0)
-                    self.mBuf[self.mBufi] = ch
-                    self.mBufi += 1
-                    if (self.mBufi == self.mMsgLen):
-                        self.mStatus = self.mStatus + 1
-                    continue
-
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_H):
-                    self.mCrc = 0
-                    # //falls through
-                if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_H or
-                    self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_L):
-                    self.mCrc = (self.mCrc << 8) | ch
-                    if (self.mStatus == self.YtDataLinkStatus.YT_DL_CRC_L):
-                        if ((self.mCrcCalc) != self.mCrc):
-                            print('[YtMsg] Error: msg crc 0x%04x != 0x%04x\n', self.toHex(self.mCrcCalc), self.toHex(self.mCrc))
-                            self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
-                            continue
-
-                        self.mStatus = self.YtDataLinkStatus.YT_DL_IDLE
-
-                        target = YtMsg()
-                        dataV2 = None
-                        target.ParseFromString(self.mBuf)
-                        if target.result.HasField('dataV2'):
-                            dataV2 = YtDataLink.DataV2(target.result.dataV2)
-                        return dataV2, target
-
-                    self.mStatus = self.mStatus + 1
-                    continue
-
-        return None, None
+    def recvRunOnce(self):
+        '''
+        The next (DataV2, YtMsg) pair, (None, None) if no message completed.
+        With borrowResults the DataV2 (and every array its results view)
+        lives in the receive buffer the following call overwrites, call
+        DataV2.keep() on frames that have to outlive it.
+        '''
+        if (len(self.heldFrames) > 0):
+            return self.heldFrames.get(0)
+        return self.readRunOnce()
+
+    def readRunOnce(self):
+        # one step of port reading and deframing, (None, None) if no frame completed
+        deframer = self.deframer
+        if deframer.pending() < 10:
+            if hasattr(self.port, 'in_waiting'):
+                # take what is buffered, or block for one byte on an idle port;
+                # asking for minReadSize would hold a short frame such as an
+                # RPC response until the port timeout
+                self.readPort(1)
+            else:
+                self.readPort(self.minReadSize)
+        payload = deframer.next()
+        if payload is None and deframer.needed() > 0:
+            # Brust read
+            self.readPort(deframer.needed())
+            payload = deframer.next()
+        if payload is None:
+            return None, None
+        return self.parseYtMsg(payload)
 
     def _sendFilePackage (self, remoteFile, totalLength, buf, offset, auth = ''):
+        rpc = YtDataLink.uploadFileRpc(remoteFile, totalLength, buf, offset, auth)
+        result = self.sendRpcMsg(rpc, 10000)
+        # print(result)
+        if (not result.HasField('response')):
+            raise Exception('未知错误')
+
+    def uploadFileRpc (remoteFile, totalLength, buf, offset, auth = ''):
+        # the YtRpc of one sendFile chunk, AsyncYtVisionSeed.sendFile sends it too
         rpc = YtRpc()
         rpc.func = YtRpc.Function.uploadFile
         rpc.auth = auth
@@ -340,10 +695,7 @@ class YtDataLink:
         params.offset = (offset)
         params.data = (buf)
         rpc.filePart.CopyFrom(params)
-        result = self.sendRpcMsg(rpc, 10000)
-        # print(result)
-        if (not result.HasField('response')):
-            raise Exception('未知错误')
+        return rpc
 
     def sendFile (self, localFile, remoteFile, auth = '', progressCb = None):
         file = open(localFile, mode='rb')
@@ -371,28 +723,184 @@ class YtDataLink:
                 progressCb(parseInt(Math.min(100 if remaining == 0 else 99, (currentOffset + sizeToTransmit) / totalLength * 100)))
 
     def genRpcId (self):
-        self.rpcId += 1
-        return self.rpcId
+        with self.rpcLock:
+            self.rpcId += 1
+            return self.rpcId
+
+    # Background reader
+    def startReader (self, frameQueue):
+        '''
+        Move all port reads to a dedicated thread. RPC responses are handed to
+        the waiting sendRpcMsg, every other message is put into frameQueue
+        (a YtFrameQueue) as a (DataV2, YtMsg) pair. A full BLOCK queue holds
+        the reader up, but not the responses of pending RPCs (see queueFrame).
+        '''
+        if not (self.reader is None):
+            raise Exception('reader already started')
+        self.frameQueue = frameQueue
+        self.readerRunning = True
+        self.reader = threading.Thread(target = self.readerLoop, name = 'YtDataLinkReader', daemon = True)
+        self.reader.start()
+
+    def stopReader (self):
+        if (self.reader is None):
+            return
+        self.readerRunning = False
+        self.frameQueue.close()
+        if (self.reader is not threading.current_thread()):
+            self.reader.join()
+        self.reader = None
+        self.rpcEngine.failAll(Exception('Reader stopped'))
+
+    def readerLoop (self):
+        while self.readerRunning and self.readerStep():
+            pass
+
+    def readerStep (self):
+        # read and route one message, False once the port failed
+        try:
+            dataV2, msg = self.recvRunOnce()
+            self.routeMessage(dataV2, msg)
+        except Exception as e:
+            self.readerFailed(e)
+            return False
+        return True
+
+    def routeMessage (self, dataV2, msg):
+        # responses to their pending RPC, everything else to frameQueue
+        if (msg is None):
+            return
+        if (msg.HasField('response') and self.dispatchResponse(msg)):
+            return
+        # queued frames outlive the receive buffer they were parsed from
+        if not (dataV2 is None):
+            dataV2.keep()
+        if (getattr(self.frameQueue, 'overflow', None) == YtFrameQueue.BLOCK):
+            self.queueFrame((dataV2, msg))
+        else:
+            self.frameQueue.put((dataV2, msg))
+
+    def queueFrame (self, frame):
+        '''
+        Put frame into a full BLOCK frameQueue without starving the RPCs:
+        while an RPC is pending the port is read on, responses are
+        dispatched and the frames behind this one wait here, at most
+        holdFrames of them (the oldest are dropped and counted in
+        heldFrames.dropped). With no RPC pending the reader just waits for
+        the consumer.
+        '''
+        frameQueue = self.frameQueue
+        backlog = collections.deque([frame])
+        while (backlog and self.readerRunning and not frameQueue.closed):
+            # poll the queue while an RPC waits, else block on it for a while
+            waiting = len(self.rpcEngine) > 0
+            if (frameQueue.put(backlog[0], 0 if waiting else 0.01)):
+                backlog.popleft()
+                continue
+            if not (waiting):
+                continue
+            dataV2, msg = self.readRunOnce()
+            if (msg is None or (msg.HasField('response') and self.dispatchResponse(msg))):
+                continue
+            if not (dataV2 is None):
+                dataV2.keep()
+            backlog.append((dataV2, msg))
+            if (len(backlog) > self.heldFrames.maxsize):
+                # backlog[0] is the frame the consumer sees next, drop the one after it
+                del backlog[1]
+                self.heldFrames.dropped += 1
+
+    def readerFailed (self, e):
+        print('[YtDataLink] reader stopped:', e)
+        self.readerRunning = False
+        self.frameQueue.close()
+        self.rpcEngine.failAll(Exception('Reader stopped: %s' % e))
+
+    def dispatchResponse (self, msg):
+        # complete the pending RPC of msg's sequenceId, False if there is none
+        return self.rpcEngine.resolve(msg)
+
+    def sendRpcMsgAsync (self, rpc, timeoutMs = 10000):
+        '''
+        Send rpc without waiting for its response, returns a
+        concurrent.futures.Future of the response YtMsg. Up to maxInFlight
+        calls can be outstanding; needs the reader thread to route the
+        responses.
+        '''
+        if (self.reader is None):
+            raise Exception('sendRpcMsgAsync needs the reader thread, call startReader first')
+        return self.rpcEngine.call(rpc, timeoutMs)
 
     def sendRpcMsg (self, rpc, timeoutMs = 10000):
+        if not (self.reader is None):
+            return self.sendRpcMsgAsync(rpc, timeoutMs).result()
+
         rpcid = self.genRpcId()
         rpc.sequenceId = rpcid
 
         msg = YtMsg()
         msg.rpc.CopyFrom(rpc)
 
+        resp = None
         self.sendYtMsg(msg)
         ts = time.time()
         while (time.time() - ts < timeoutMs/1000):
-            _, resp = self.recvRunOnce()
-            if (resp and resp.HasField('response')):
-                if (resp.response.sequenceId == rpcid):
-                    if (resp.response.code != YtRpcResponse.ReturnCode.SUCC and
-                        resp.response.code != YtRpcResponse.ReturnCode.CONTINUE):
-                        err = self.getErrMsg(resp.response.code)
-                        raise Exception(err)
-                    return resp
-        raise Exception('Timeout')
+            dataV2, msg = self.readRunOnce()
+            if (msg is None):
+                continue
+            if (msg.HasField('response') and msg.response.sequenceId == rpcid):
+                resp = msg
+                break
+            # hold everything else for recvRunOnce, the result stream has no gap
+            if not (dataV2 is None):
+                dataV2.keep()
+            self.heldFrames.put((dataV2, msg))
+
+        if (resp is None):
+            raise Exception('Timeout')
+        if (resp.response.code != YtRpcResponse.ReturnCode.SUCC and
+            resp.response.code != YtRpcResponse.ReturnCode.CONTINUE):
+            err = self.getErrMsg(resp.response.code)
+            raise Exception(err)
+        return resp
+
+    def sendRpcBatch (self, rpcs, timeoutMs = 10000):
+        '''
+        Send rpcs back to back and wait for all their responses, so a batch
+        costs about one round trip. Returns one entry per rpc, in order:
+        the response YtMsg, or the Exception (Timeout or getErrMsg text)
+        sendRpcMsg would have raised for it.
+        '''
+        if not (self.reader is None):
+            futures = [self.sendRpcMsgAsync(rpc, timeoutMs) for rpc in rpcs]
+            return [future.exception() or future.result() for future in futures]
+
+        rpcids = {}
+        for i, rpc in enumerate(rpcs):
+            rpc.sequenceId = self.genRpcId()
+            rpcids[rpc.sequenceId] = i
+            msg = YtMsg()
+            msg.rpc.CopyFrom(rpc)
+            self.sendYtMsg(msg)
+
+        ret = [Exception('Timeout')] * len(rpcs)
+        ts = time.time()
+        while (rpcids and time.time() - ts < timeoutMs/1000):
+            dataV2, msg = self.readRunOnce()
+            if (msg is None):
+                continue
+            if (msg.HasField('response') and msg.response.sequenceId in rpcids):
+                i = rpcids.pop(msg.response.sequenceId)
+                if (msg.response.code != YtRpcResponse.ReturnCode.SUCC and
+                    msg.response.code != YtRpcResponse.ReturnCode.CONTINUE):
+                    ret[i] = Exception(self.getErrMsg(msg.response.code))
+                else:
+                    ret[i] = msg
+                continue
+            if not (dataV2 is None):
+                dataV2.keep()
+            self.heldFrames.put((dataV2, msg))
+        return ret
 
     def sendYtMsg (self, msg):
         data = msg.SerializeToString()
@@ -421,53 +929,29 @@ class YtDataLink:
 
         self.mCrcSendCalc = self.ccittTable[(self.mCrcSendCalc >> 8 ^ ch) & 0xff] ^ ((self.mCrcSendCalc << 8) & 0xffff)
 
-    def write (self, data):
-        buf = bytearray(len(data) + 8)
-        buf[0] = 0x10
-        buf[1] = (len(data) >> 16) & 0xff
-        buf[2] = (len(data) >> 8) & 0xff
-        buf[3] = (len(data) >> 0) & 0xff
-        self.crcSendUpdate(buf[1], True)
-        self.crcSendUpdate(buf[2])
-        self.crcSendUpdate(buf[3])
-        buf[4] = (self.mCrcSendCalc >> 8) & 0xff
-        buf[5] = (self.mCrcSendCalc >> 0) & 0xff
-        buf[6:] = data
-        buf.append(0)
-        buf.append(0)
-
-        transLen = 0
-        # self.printBuf(buf)
-        for i in range(1, len(buf)):
-            # print(i, self.toHex(buf[i]))
-            if (i >= 6 and i < len(buf) - 2):
-                self.crcSendUpdate(buf[i], i == 6)
-            if (buf[i] == 0x10 or buf[i] == 0x11):
-                transLen += 1
-
-        buf[len(buf) - 2] = (self.mCrcSendCalc >> 8) & 0xff
-        buf[len(buf) - 1] = (self.mCrcSendCalc >> 0) & 0xff
-
-        for i in range(len(buf)-2, len(buf)):
-            # print(i, self.toHex(buf[i]))
-            if (buf[i] == 0x10 or buf[i] == 0x11):
-                transLen += 1
-
-        idx = 0
-        transedBuffer = bytearray(len(buf) + transLen)
-
-        for i in range(0, len(buf)):
-            if ((buf[i] == 0x10 or buf[i] == 0x11) and i > 0):
-                transedBuffer[idx] = 0x11
-                idx += 1
-                transedBuffer[idx] = buf[i] ^ 0x11
-                idx += 1
-            else:
-                transedBuffer[idx] = buf[i]
-                idx += 1
+    def escape (self, buf):
+        # 0x11 has to go first, escaping 0x10 produces new 0x11 bytes
+        return bytes(buf).replace(b'\x11', b'\x11\x00').replace(b'\x10', b'\x11\x01')
 
+    def write (self, data):
+        length = len(data)
+        head = bytearray(5)
+        head[0] = (length >> 16) & 0xff
+        head[1] = (length >> 8) & 0xff
+        head[2] = (length >> 0) & 0xff
+        crc = crcCcitt(memoryview(head)[0:3])
+        head[3] = (crc >> 8) & 0xff
+        head[4] = (crc >> 0) & 0xff
+
+        crc = crcCcitt(data)
+        tail = bytes([(crc >> 8) & 0xff, (crc >> 0) & 0xff])
+
+        # SOF is the only byte sent unescaped
+        transedBuffer = b''.join((b'\x10', self.escape(head), self.escape(data), self.escape(tail)))
         # self.printBuf(transedBuffer)
-        self.port.write(transedBuffer)
+        # RPCs may be sent from several threads, one frame goes out whole
+        with self.writeLock:
+            self.port.write(transedBuffer)
 
     # 结果包解析
     def unpackInt16 (bufObj):
@@ -501,3 +985,7 @@ class YtDataLink:
                 break
             shift += 7
         return ret
+
+# the decoders every DataV2 uses unless given its own registry, applications
+# add result types with YtDataLink.decoders.register(type, decoder, ...)
+YtDataLink.decoders = YtDataLink.DecoderRegistry.defaults()
@@ -1,4 +1,5 @@
 from .YtMsg_pb2 import *
+import numpy as np
 import math
 
 class Point:
@@ -16,38 +17,79 @@ class Point:
     def length(self):
         return math.sqrt(self.x**2 + self.y**2)
 
+class Points(np.ndarray):
+    '''
+    (..., 2) array of x, y coordinates. A single row keeps the .x/.y and
+    length() of the old Point objects, so points[i].x and
+    (mouth[0] - mouth[6]).length() still work, while whole arrays and
+    stacks of faces are handled in one vectorized call.
+    '''
+    def __new__(cls, array):
+        return np.asarray(array).view(cls)
+
+    @property
+    def x(self):
+        if (self.ndim == 1):
+            return self[0].item()
+        return self[..., 0].view(np.ndarray)
+
+    @property
+    def y(self):
+        if (self.ndim == 1):
+            return self[1].item()
+        return self[..., 1].view(np.ndarray)
+
+    def length(self):
+        ret = np.hypot(self[..., 0].view(np.ndarray), self[..., 1].view(np.ndarray), dtype = np.float64)
+        return ret.item() if ret.ndim == 0 else ret
+
+def distance(a, b):
+    # euclidean distance between two (..., 2) point arrays
+    return (Points(a) - Points(b)).length()
+
+def centroid(points):
+    # (..., K, 2) -> (..., 2) mean point of each group
+    return Points(np.asarray(points).mean(axis = -2))
+
+def boundingBox(points):
+    # (..., K, 2) -> (..., 4) x, y, w, h of each group
+    points = np.asarray(points)
+    low = points.min(axis = -2)
+    high = points.max(axis = -2)
+    return np.concatenate((low, high - low), axis = -1)
+
 class YtFaceShape:
+    '''
+    90 landmark points backed by one (90, 2) array, or a stack of faces as
+    (N, 90, 2). The regions are zero-copy slice views of that array: for a
+    single face mouth[0] is a point, for a stack mouth[:, 0] is the first
+    mouth point of every face.
+    '''
+    REGIONS = (
+        ('leftEyebrow', 0, 8),
+        ('rightEyebrow', 8, 16),
+        ('leftEye', 16, 24),
+        ('rightEye', 24, 32),
+        ('nose', 32, 45),
+        ('mouth', 45, 67),
+        ('faceProfile', 67, 88),
+        ('pupil', 88, 90),
+    )
+    __slots__ = ('points',) + tuple(name for name, start, stop in REGIONS)
+
     def __init__(self, points):
-        self.leftEyebrow = [None]*8
-        self.rightEyebrow = [None]*8
-        self.leftEye = [None]*8
-        self.rightEye = [None]*8
-        self.nose = [None]*13
-        self.mouth = [None]*22
-        self.faceProfile = [None]*21
-        self.pupil = [None]*2
-        idx = 0
-        for i in range(len(self.leftEyebrow)):
-            self.leftEyebrow[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.rightEyebrow)):
-            self.rightEyebrow[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.leftEye)):
-            self.leftEye[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.rightEye)):
-            self.rightEye[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.nose)):
-            self.nose[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.mouth)):
-            self.mouth[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.faceProfile)):
-            self.faceProfile[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
-        for i in range(len(self.pupil)):
-            self.pupil[i] = Point(points.points[idx].x, points.points[idx].y)
-            idx += 1
+        # a YtVisionSeedResultTypePoints, or an array of (90, 2) / (N, 90, 2)
+        if hasattr(points, 'points'):
+            points = points.points
+        self.points = Points(points)
+        for name, start, stop in self.REGIONS:
+            setattr(self, name, self.points[..., start:stop, :])
+
+    def region(self, name):
+        return getattr(self, name)
+
+    def centroid(self, name):
+        return centroid(self.region(name))
+
+    def boundingBox(self, name):
+        return boundingBox(self.region(name))
@@ -0,0 +1,117 @@
+# /**
+#  * Pair camera frames with result messages by frameId
+#  */
+import collections
+import threading
+from .YtFrameQueue import YtFrameQueue
+
+class YtFrameJoiner:
+    '''
+    Joins two streams keyed by frameId, e.g. UVC video frames and DataV2
+    results. Each side waits in a bounded buffer for its partner; matched
+    (frameId, frame, result) pairs are queued for get(). The producers
+    never block: entries that can no longer match, or overflow a buffer,
+    are dropped and counted on the side they came from.
+    '''
+    class Side:
+        def __init__(self, lateness):
+            # frameId -> item, in arrival order
+            self.items = collections.OrderedDict()
+            self.lateness = lateness
+            self.newest = None
+            self.unmatched = 0   # gave up on, the other stream moved past it
+            self.evicted = 0     # pushed out by maxPending
+            self.resyncs = 0     # restarts after a frameId jump
+
+        def __len__(self):
+            return len(self.items)
+
+    def __init__(self, maxPending = 32, videoLateness = 8, resultLateness = 8, maxMatched = 8, maxGap = 3600):
+        '''
+        A video frame waits for its result until the result stream is
+        videoLateness frameIds past it, a result waits for its frame until
+        the video stream is resultLateness frameIds past it. At most
+        maxPending entries wait per side and maxMatched pairs are queued,
+        the oldest pair is dropped when the consumer falls behind.
+
+        A frameId more than maxGap ahead of the newest of its side, or more
+        than maxPending behind it (a device reboot, uint32 wrap or corrupt
+        id), restarts that side from it: its waiting entries are given up,
+        and entries are only dropped for being behind the other side while
+        both are within maxGap of each other.
+        '''
+        if (maxPending < 1):
+            raise ValueError('maxPending must be positive')
+        self.maxPending = maxPending
+        self.maxGap = maxGap
+        self.video = YtFrameJoiner.Side(videoLateness)
+        self.results = YtFrameJoiner.Side(resultLateness)
+        self.matched = 0
+        self.lock = threading.Lock()
+        self.pairs = YtFrameQueue(maxMatched, YtFrameQueue.DROP_OLDEST)
+
+    @property
+    def droppedPairs(self):
+        return self.pairs.dropped
+
+    def putVideo(self, frameId, frame):
+        # returns True if frame completed a pair
+        return self.put(self.video, self.results, frameId, frame)
+
+    def putResult(self, frameId, result):
+        # returns True if result completed a pair
+        return self.put(self.results, self.video, frameId, result)
+
+    def put(self, own, other, frameId, item):
+        with self.lock:
+            if (own.newest is not None and not (own.newest - self.maxPending <= frameId <= own.newest + self.maxGap)):
+                own.unmatched += len(own.items)
+                own.items.clear()
+                own.newest = frameId
+                own.resyncs += 1
+            else:
+                if (own.newest is None or frameId > own.newest):
+                    own.newest = frameId
+                self.expire(other, own.newest)
+            if (frameId in other.items):
+                otherItem = other.items.pop(frameId)
+                self.matched += 1
+                if (own is self.video):
+                    self.pairs.put((frameId, item, otherItem))
+                else:
+                    self.pairs.put((frameId, otherItem, item))
+                return True
+            if (other.newest is not None and other.newest - self.maxGap <= frameId < other.newest - own.lateness):
+                # its partner went by already
+                own.unmatched += 1
+                return False
+            if (frameId in own.items):
+                # a repeated frameId replaces the waiting entry
+                del own.items[frameId]
+                own.unmatched += 1
+            own.items[frameId] = item
+            if (len(own.items) > self.maxPending):
+                own.items.popitem(last = False)
+                own.evicted += 1
+            return False
+
+    def expire(self, side, newest):
+        # drop the entries of side the other stream is more than side.lateness past
+        items = side.items
+        while items:
+            frameId = next(iter(items))
+            if (frameId >= newest - side.lateness):
+                break
+            del items[frameId]
+            side.unmatched += 1
+
+    def get(self, timeout = None):
+        '''
+        The oldest matched (frameId, frame, result), waiting up to timeout
+        seconds (None waits forever, 0 polls). Returns None on timeout or
+        once closed and drained.
+        '''
+        return self.pairs.get(timeout)
+
+    def close(self):
+        self.pairs.close()
@@ -0,0 +1,67 @@
+# /**
+#  * Bounded, thread-safe queue of received (DataV2, YtMsg) pairs
+#  */
+import collections
+import threading
+
+class YtFrameQueue:
+    # What put() does when the queue is full
+    BLOCK = 'block'              # wait until the consumer takes a frame
+    DROP_OLDEST = 'drop-oldest'  # discard the oldest queued frame
+    DROP_NEWEST = 'drop-newest'  # discard the frame being put
+
+    def __init__(self, maxsize = 64, overflow = BLOCK):
+        if (overflow not in (self.BLOCK, self.DROP_OLDEST, self.DROP_NEWEST)):
+            raise ValueError('unknown overflow policy: %s' % overflow)
+        if (maxsize < 1):
+            raise ValueError('maxsize must be positive')
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.dropped = 0
+        self.closed = False
+        self.items = collections.deque()
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item, timeout = None):
+        '''
+        Queue item, applying the overflow policy when full. Returns False if
+        the item was not queued (dropped, timed out, or queue closed).
+        '''
+        with self.cond:
+            if (len(self.items) >= self.maxsize):
+                if (self.overflow == self.DROP_NEWEST):
+                    self.dropped += 1
+                    return False
+                if (self.overflow == self.DROP_OLDEST):
+                    self.items.popleft()
+                    self.dropped += 1
+                elif not self.cond.wait_for(lambda: self.closed or len(self.items) < self.maxsize, timeout):
+                    return False
+            if (self.closed):
+                return False
+            self.items.append(item)
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout = None):
+        '''
+        Take the oldest item, waiting up to timeout seconds (None waits
+        forever). Returns None on timeout or once closed and drained.
+        '''
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.closed or self.items, timeout):
+                return None
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.cond.notify_all()
+            return item
+
+    def close(self):
+        # wake up every waiter, queued items can still be drained with get()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
@@ -0,0 +1,115 @@
+# /**
+#  * Pipelined RPCs: several requests in flight, responses matched by sequenceId
+#  */
+from .YtMsg_pb2 import *
+import concurrent.futures
+import heapq
+import threading
+import time
+
+class YtRpcEngine:
+    '''
+    Sends YtRpc requests without waiting for the previous response. Every
+    request gets a concurrent.futures.Future that resolves to the response
+    YtMsg, or fails with Exception('Timeout') past its deadline or with the
+    getErrMsg text of an error code, as sendRpcMsg does. At most
+    maxInFlight requests are outstanding, call() waits for a free slot.
+
+    Responses are routed here by the data link's reader thread through
+    resolve().
+    '''
+    def __init__(self, datalink, maxInFlight = 8):
+        if (maxInFlight < 1):
+            raise ValueError('maxInFlight must be positive')
+        self.datalink = datalink
+        self.maxInFlight = maxInFlight
+        self.slots = threading.BoundedSemaphore(maxInFlight)
+        self.cond = threading.Condition()
+        self.pending = {}      # sequenceId -> Future
+        self.deadlines = []    # heap of (deadline, sequenceId)
+        self.timer = None
+
+    def __len__(self):
+        return len(self.pending)
+
+    def call(self, rpc, timeoutMs = 10000):
+        '''
+        Send rpc and return its Future. timeoutMs bounds both the wait for
+        an in-flight slot and the wait for the response.
+        '''
+        deadline = time.monotonic() + timeoutMs / 1000
+        future = concurrent.futures.Future()
+        if not self.slots.acquire(timeout = timeoutMs / 1000):
+            future.set_exception(Exception('Timeout'))
+            return future
+        future.add_done_callback(lambda _: self.slots.release())
+
+        rpcid = self.datalink.genRpcId()
+        rpc.sequenceId = rpcid
+        msg = YtMsg()
+        msg.rpc.CopyFrom(rpc)
+        with self.cond:
+            self.pending[rpcid] = future
+            heapq.heappush(self.deadlines, (deadline, rpcid))
+            if (self.timer is None):
+                self.timer = threading.Thread(target = self.expireLoop, name = 'YtRpcEngineTimer', daemon = True)
+                self.timer.start()
+            self.cond.notify()
+        try:
+            self.datalink.sendYtMsg(msg)
+        except Exception as e:
+            with self.cond:
+                self.pending.pop(rpcid, None)
+            self.settle(future, None, e)
+        return future
+
+    def resolve(self, msg):
+        # complete the request msg answers, False if none is pending
+        with self.cond:
+            future = self.pending.pop(msg.response.sequenceId, None)
+        if (future is None):
+            return False
+        if (msg.response.code != YtRpcResponse.ReturnCode.SUCC and
+            msg.response.code != YtRpcResponse.ReturnCode.CONTINUE):
+            self.settle(future, None, Exception(self.datalink.getErrMsg(msg.response.code)))
+        else:
+            self.settle(future, msg, None)
+        return True
+
+    def failAll(self, exception):
+        # fail every pending request, e.g. when the reader stops
+        with self.cond:
+            futures = list(self.pending.values())
+            self.pending.clear()
+            self.deadlines.clear()
+            self.cond.notify()
+        for future in futures:
+            self.settle(future, None, exception)
+
+    def settle(self, future, result, exception):
+        # the caller may have cancelled the future meanwhile
+        try:
+            if (exception is None):
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def expireLoop(self):
+        # fails requests past their deadline, runs while any are pending
+        while True:
+            with self.cond:
+                while (self.deadlines and self.deadlines[0][1] not in self.pending):
+                    heapq.heappop(self.deadlines)
+                if not self.deadlines:
+                    self.timer = None
+                    return
+                deadline, rpcid = self.deadlines[0]
+                wait = deadline - time.monotonic()
+                if (wait > 0):
+                    self.cond.wait(wait)
+                    continue
+                heapq.heappop(self.deadlines)
+                future = self.pending.pop(rpcid)
+            self.settle(future, None, Exception('Timeout'))
@@ -5,6 +5,7 @@
 from .YtMsg_pb2 import *
 from . import YtFaceAlignment
 from .YtDataLink import YtDataLink
+from .YtFrameQueue import YtFrameQueue
 from .CameraExposureParams_pb2 import *
 from .FlasherParams_pb2 import *
 from .FaceDetectionResult_pb2 import *
@@ -14,178 +15,496 @@ from .FilePart_pb2 import *
 from .RegisterFaceIdWithPicParams_pb2 import *
 import numpy as np
 import struct
+import threading
+import time
 
 class YtVisionSeed:
-    def __init__(self, port):
-        self.datalink = YtDataLink( port )
+    class Event:
+        def __init__(self, result, msg):
+            self.result = result
+            self.msg = msg
+    class ResultEvent(Event):
+        # a result frame, result is the parsed DataV2 (None for legacy result types)
+        def __init__(self, result, msg):
+            super().__init__(result, msg)
+            self.frameId = msg.result.frameId
+    class ResponseEvent(Event):
+        # an RPC response no sendRpcMsg was waiting for
+        def __init__(self, result, msg):
+            super().__init__(result, msg)
+            self.response = msg.response
+    class StatusEvent(Event):
+        def __init__(self, result, msg):
+            super().__init__(result, msg)
+            self.status = msg.result.systemStatusResult
+
+    class Rpcs:
+        '''
+        The YtRpc of every call and the readers of its response, shared by
+        YtVisionSeed, YtVisionSeedBatch and AsyncYtVisionSeed. Setters
+        return (key, value, rpc) for applySetting.
+        '''
+        # Camera
+        def setCamAutoExposure (camId):
+            rpc = YtRpc()
+            rpc.func = (rpc.setExposure)
+            cameraExposureParams = CameraExposureParams()
+            cameraExposureParams.type = (1)
+            cameraExposureParams.camId = (camId)
+            rpc.cameraExposureParams.CopyFrom(cameraExposureParams)
+            return ('exposure', camId), ('auto',), rpc
+
+        def setCamManualExposure (camId, timeUs, gain):
+            rpc = YtRpc()
+            rpc.func = (rpc.setExposure)
+            cameraExposureParams = CameraExposureParams()
+            cameraExposureParams.type = (0)
+            cameraExposureParams.timeUs = (timeUs)
+            cameraExposureParams.gain = (gain)
+            cameraExposureParams.camId = (camId)
+            rpc.cameraExposureParams.CopyFrom(cameraExposureParams)
+            return ('exposure', camId), ('manual', timeUs, gain), rpc
+
+        def setFlasher (flasherIR):
+            rpc = YtRpc()
+            rpc.func = (rpc.setFlasher)
+            flashParams = FlasherParams()
+            flashParams.ir = (flasherIR)
+            rpc.flasherParams.CopyFrom(flashParams)
+            return 'flasher', flasherIR, rpc
+
+        def setMainCamId (value):
+            rpc = YtRpc()
+            rpc.func = (rpc.setMainCamera)
+            rpc.intParams = (value)
+            return 'mainCamId', value, rpc
+
+        def setRotation (value):
+            rpc = YtRpc()
+            rpc.func = (rpc.setCameraRotation)
+            rpc.intParams = (value)
+            return 'rotation', value, rpc
+
+        def setDebugDrawing (value):
+            rpc = YtRpc()
+            rpc.func = (rpc.setDebugDrawing)
+            rpc.intParams = (value)
+            return 'debugDrawing', value, rpc
+
+        # Files
+        def listFile (path):
+            rpc = YtRpc()
+            rpc.func = (rpc.listFile)
+            rpc.strParams = (path)
+            return rpc
+
+        def readFileList (result):
+            if (result.response):
+                return result.response.fileListResult.files
+            return None
+
+        def deleteFile (path, auth = ''):
+            rpc = YtRpc()
+            rpc.func = (rpc.deleteFile)
+            rpc.strParams = (path)
+            rpc.auth = (auth)
+            return rpc
+
+        def getConfig (domain):
+            rpc = YtRpc()
+            rpc.func = (rpc.getConfig)
+            rpc.strParams = (domain)
+            return rpc
+
+        def readConfig (result):
+            if (result.response):
+                return str(result.response.filePart.data, encoding = "utf-8")
+            return None
+
+        def setConfig (domain, content):
+            data = bytes(content, encoding = "utf8")
+            rpc = YtRpc()
+            rpc.func = (rpc.setConfig)
+            params = FilePart()
+            params.path = (domain)
+            params.totalLength = len(content)
+            params.offset = (0)
+            params.data = (data)
+            rpc.filePart.CopyFrom(params)
+            return ('config', domain), content, rpc
+
+        def resetConfig (domain):
+            rpc = YtRpc()
+            rpc.func = (rpc.resetConfig)
+            rpc.strParams = (domain)
+            return rpc
+
+        # Info
+        def getDeviceInfo ():
+            rpc = YtRpc()
+            rpc.func = (rpc.getDeviceInfo)
+            return rpc
+
+        def readDeviceInfo (result):
+            if (result.response):
+                return result.response.strData.split(' ')
+
+        # Face retrieve
+        def getTracePic (traceId):
+            rpc = YtRpc()
+            rpc.func = (rpc.getTracePic)
+            rpc.intParams = (traceId)
+            return rpc
+
+        def getFacePic (faceId):
+            rpc = YtRpc()
+            rpc.func = (rpc.getFacePic)
+            rpc.intParams = (faceId)
+            return rpc
+
+        def clearFaceLib ():
+            rpc = YtRpc()
+            rpc.func = (rpc.clearFaceLib)
+            return rpc
+
+        def setFaceId (faceId, faceName):
+            rpc = YtRpc()
+            rpc.func = (rpc.setFaceId)
+            params = SetFaceIdParams()
+            params.faceId = (faceId)
+            params.faceName = (faceName)
+            rpc.setFaceIdParams.CopyFrom(params)
+            return rpc
+
+        def registerFaceIdFromCamera (faceName, timeoutMs):
+            rpc = YtRpc()
+            rpc.func = (rpc.registerFaceIdFromCamera)
+            params = RegisterFaceIdFromCameraParams()
+            params.timeoutMs = (timeoutMs)
+            params.faceName = (faceName)
+            rpc.registerFaceIdFromCameraParams.CopyFrom(params)
+            return rpc
+
+        def registerFaceIdWithRemotePic (remoteFile, faceName):
+            rpc = YtRpc()
+            rpc.func = (rpc.registerFaceIdWithPic)
+            params = RegisterFaceIdWithPicParams()
+            params.filePath = (remoteFile)
+            params.faceName = (faceName)
+            rpc.registerFaceIdWithPicParams.CopyFrom(params)
+            return rpc
+
+        def readFaceId (result):
+            # the faceId a registration returns
+            if (result.HasField('response') and result.response.HasField('intData')):
+                return result.response.intData
+            else:
+                raise Exception('未知错误')
+
+        def deleteFaceId (faceId):
+            rpc = YtRpc()
+            rpc.func = (rpc.deleteFaceId)
+            rpc.intParams = (faceId)
+            return rpc
+
+        def deleteFaceName (faceName):
+            rpc = YtRpc()
+            rpc.func = (rpc.deleteFaceName)
+            rpc.strParams = (faceName)
+            return rpc
+
+        def listFaceId (start):
+            # one page of up to 100 faceIds from start on
+            rpc = YtRpc()
+            rpc.func = (rpc.listFaceId)
+            params = ListFaceIdParams()
+            params.start = (start)
+            params.length = (100)
+            rpc.listFaceIdParams.CopyFrom(params)
+            return rpc
+
+    # the data link class __init__ builds, subclasses may swap it
+    datalinkClass = YtDataLink
+
+    def __init__(self, port, readerThread = False, queueSize = 64, overflow = YtFrameQueue.BLOCK, lazyResults = False, fastResults = True, arrayViews = False, maxInFlight = 8, shadowState = False, debounceMs = 0, borrowResults = False, decoders = None):
+        self.datalink = self.datalinkClass( port, lazyResults = lazyResults, fastResults = fastResults, arrayViews = arrayViews, maxInFlight = maxInFlight, holdFrames = queueSize, borrowResults = borrowResults, decoders = decoders )
+        self.frameQueue = None
+        # last successfully applied value of each setting, None disables skipping
+        self.shadow = {} if shadowState else None
+        self.debounceMs = debounceMs
+        self.lastApplied = {}
+        self.deferred = {}
+        self.flushTimer = None
+        # one lock per setting key, held from the shadow check to its update
+        self.settingLocks = {}
+        self.settingLocksLock = threading.Lock()
+        if (readerThread):
+            self.startReader(queueSize, overflow)
+
+    # Reader thread
+    def startReader (self, queueSize = 64, overflow = YtFrameQueue.BLOCK):
+        '''
+        Read and parse the port on a dedicated thread. Completed frames are
+        kept in a bounded queue of queueSize; overflow is one of
+        YtFrameQueue.BLOCK, DROP_OLDEST or DROP_NEWEST. RPCs are answered
+        even while a BLOCK queue is full, the frames read past meanwhile
+        wait in the reader (up to queueSize, then the oldest are dropped).
+        '''
+        self.frameQueue = YtFrameQueue(queueSize, overflow)
+        self.datalink.startReader(self.frameQueue)
+
+    def stopReader (self):
+        self.datalink.stopReader()
+        self.frameQueue = None
+
+    def droppedFrames (self):
+        # frames lost to a full queue, including those held while an RPC polled the port
+        dropped = self.datalink.heldFrames.dropped
+        if not (self.frameQueue is None):
+            dropped += self.frameQueue.dropped
+        return dropped
+
+    def subscribe (self, patterns):
+        '''
+        Declare the result paths the application reads, e.g.
+        [[FACE_DETECTION], [FACE_DETECTION, None], [FACE_DETECTION, None, DETECTION_TRACE]];
+        the parser skips every other model output. None undoes it.
+        '''
+        self.datalink.subscribe(patterns)
+
+    def toEvent (self, result, msg):
+        if (msg.HasField('response')):
+            return YtVisionSeed.ResponseEvent(result, msg)
+        if (msg.result.HasField('systemStatusResult')):
+            return YtVisionSeed.StatusEvent(result, msg)
+        return YtVisionSeed.ResultEvent(result, msg)
+
+    def results (self, timeout = None):
+        '''
+        Iterate over received messages as ResultEvent/ResponseEvent/StatusEvent,
+        blocking on the reader thread's queue instead of polling recvRunOnce.
+        Ends after timeout seconds without a message (None waits forever) or
+        when the reader stops.
+
+        If no reader runs yet one is started with DROP_OLDEST, so frames
+        arriving while the loop body is busy (or after it was left) only
+        push out stale ones; it keeps running until stopReader(). Call
+        startReader first to choose another policy.
+        '''
+        if (self.frameQueue is None):
+            self.startReader(overflow = YtFrameQueue.DROP_OLDEST)
+        frameQueue = self.frameQueue
+        while True:
+            frame = frameQueue.get(timeout)
+            if (frame is None):
+                return
+            self.flushDue()
+            yield self.toEvent(*frame)
 
     def recvRunOnce (self):
-        return self.datalink.recvRunOnce()
+        # see YtDataLink.recvRunOnce; frames from the reader thread are always kept
+        self.flushDue()
+        if (self.frameQueue is None):
+            return self.datalink.recvRunOnce()
+        # wait as long as a direct port read would
+        frame = self.frameQueue.get(getattr(self.datalink.port, 'timeout', None))
+        if (frame is None):
+            return None, None
+        return frame
+
+    # Device state shadow
+    def applySetting (self, key, value, rpc):
+        '''
+        Send a setter rpc that makes setting key equal value. With
+        shadowState, a value the device already has is not sent again, and
+        with debounceMs a write coming sooner than that after the previous
+        one of key is deferred. The latest deferred value is sent once it is
+        due by the next setter, recvRunOnce or results(), and while a reader
+        thread runs by a timer too; without one the application has to keep
+        calling recvRunOnce (or flush()) for the trailing write to go out.
+        '''
+        if (self.shadow is None):
+            self.datalink.sendRpcMsg(rpc)
+            return
+        self.flushDue()
+        with self.settingLock(key):
+            if (key in self.shadow and self.shadow[key] == value):
+                self.deferred.pop(key, None)
+                return
+            if (self.debounceMs > 0 and key in self.lastApplied):
+                due = self.lastApplied[key] + self.debounceMs / 1000
+                if (time.monotonic() < due):
+                    self.deferred[key] = (value, rpc, due)
+                    self.scheduleFlush()
+                    return
+            self.deferred.pop(key, None)
+            self.sendSetting(key, value, rpc)
+
+    def settingLock (self, key):
+        '''
+        The lock serializing the writes of setting key, so that threads
+        setting it concurrently leave the shadow with the value the device
+        got last.
+        '''
+        with self.settingLocksLock:
+            lock = self.settingLocks.get(key)
+            if (lock is None):
+                lock = self.settingLocks[key] = threading.Lock()
+            return lock
+
+    def sendSetting (self, key, value, rpc):
+        # with settingLock(key) held
+        try:
+            self.datalink.sendRpcMsg(rpc)
+        except Exception:
+            # the device may or may not have applied it
+            self.shadow.pop(key, None)
+            raise
+        self.shadow[key] = value
+        self.lastApplied[key] = time.monotonic()
+
+    def flush (self):
+        # send every deferred setting now
+        for key in list(self.deferred):
+            with self.settingLock(key):
+                entry = self.deferred.pop(key, None)
+                if not (entry is None):
+                    self.sendSetting(key, entry[0], entry[1])
+
+    def flushDue (self):
+        if not (self.deferred):
+            return
+        now = time.monotonic()
+        for key, (value, rpc, due) in list(self.deferred.items()):
+            if (due > now):
+                continue
+            with self.settingLock(key):
+                # another thread may have flushed or replaced it meanwhile
+                entry = self.deferred.get(key)
+                if (entry is None or entry[2] > now):
+                    continue
+                del self.deferred[key]
+                try:
+                    self.sendSetting(key, entry[0], entry[1])
+                except Exception as e:
+                    print('[YtVisionSeed] deferred setting', key, 'failed:', e)
+
+    def scheduleFlush (self):
+        # the trailing flush of deferred settings, only while a reader thread
+        # answers the RPCs, the port must not be polled from the timer
+        if (self.datalink.reader is None or not (self.flushTimer is None)):
+            return
+        deferred = list(self.deferred.values())
+        if not (deferred):
+            return
+        delay = min(due for value, rpc, due in deferred) - time.monotonic()
+        self.flushTimer = threading.Timer(max(0, delay), self.trailingFlush)
+        self.flushTimer.daemon = True
+        self.flushTimer.start()
+
+    def trailingFlush (self):
+        self.flushTimer = None
+        if (self.datalink.reader is None):
+            return
+        self.flushDue()
+        self.scheduleFlush()
+
+    def invalidate (self, key = None):
+        '''
+        Forget the shadowed state, of one setting key or of all after a
+        device reboot, so the next write is sent whatever its value.
+        '''
+        if (self.shadow is None):
+            return
+        if (key is None):
+            self.shadow.clear()
+        else:
+            self.shadow.pop(key, None)
+
+    def batch (self, timeoutMs = 10000):
+        '''
+        Collect setter calls and send them pipelined, e.g.
+            batch = vs.batch()
+            batch.setFlasher(1)
+            batch.setRotation(90)
+            errors = batch.send()
+        or as a with block, which sends on exit and raises if any failed.
+        '''
+        return YtVisionSeedBatch(self, timeoutMs)
 
     # Camera
     def setCamAutoExposure (self, camId):
-        rpc = YtRpc()
-        rpc.func = (rpc.setExposure)
-        cameraExposureParams = CameraExposureParams()
-        cameraExposureParams.type = (1)
-        cameraExposureParams.camId = (camId)
-        rpc.cameraExposureParams.CopyFrom(cameraExposureParams)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setCamAutoExposure(camId))
 
     def setCamManualExposure (self, camId, timeUs, gain):
-        rpc = YtRpc()
-        rpc.func = (rpc.setExposure)
-        cameraExposureParams = CameraExposureParams()
-        cameraExposureParams.type = (0)
-        cameraExposureParams.timeUs = (timeUs)
-        cameraExposureParams.gain = (gain)
-        cameraExposureParams.camId = (camId)
-        rpc.cameraExposureParams.CopyFrom(cameraExposureParams)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setCamManualExposure(camId, timeUs, gain))
 
     def setFlasher (self, flasherIR):
-        rpc = YtRpc()
-        rpc.func = (rpc.setFlasher)
-        flashParams = FlasherParams()
-        flashParams.ir = (flasherIR)
-        rpc.flasherParams.CopyFrom(flashParams)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setFlasher(flasherIR))
 
     def setMainCamId (self, value):
-        rpc = YtRpc()
-        rpc.func = (rpc.setMainCamera)
-        rpc.intParams = (value)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setMainCamId(value))
 
     def setRotation (self, value):
-        rpc = YtRpc()
-        rpc.func = (rpc.setCameraRotation)
-        rpc.intParams = (value)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setRotation(value))
 
     def setDebugDrawing (self, value):
-        rpc = YtRpc()
-        rpc.func = (rpc.setDebugDrawing)
-        rpc.intParams = (value)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setDebugDrawing(value))
 
 
     # Files
     def listFile (self, path):
-        rpc = YtRpc()
-        rpc.func = (rpc.listFile)
-        rpc.strParams = (path)
-        result = self.datalink.sendRpcMsg(rpc)
-        if (result.response):
-            return result.response.fileListResult.files
-
-        return None
+        result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.listFile(path))
+        return YtVisionSeed.Rpcs.readFileList(result)
 
     def deleteFile (self, path, auth = ''):
-        rpc = YtRpc()
-        rpc.func = (rpc.deleteFile)
-        rpc.strParams = (path)
-        rpc.auth = (auth)
-        self.datalink.sendRpcMsg(rpc)
+        self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.deleteFile(path, auth))
 
 
     def getConfig (self, domain):
-        rpc = YtRpc()
-        rpc.func = (rpc.getConfig)
-        rpc.strParams = (domain)
-        result = self.datalink.sendRpcMsg(rpc)
-        if (result.response):
-            return str(result.response.filePart.data, encoding = "utf-8")
-
-        return None
+        result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.getConfig(domain))
+        return YtVisionSeed.Rpcs.readConfig(result)
 
 
     def setConfig (self, domain, content):
-        data = bytes(content, encoding = "utf8")
-        rpc = YtRpc()
-        rpc.func = (rpc.setConfig)
-        params = FilePart()
-        params.path = (domain)
-        params.totalLength = len(content)
-        params.offset = (0)
-        params.data = (data)
-        rpc.filePart.CopyFrom(params)
-        self.datalink.sendRpcMsg(rpc)
+        self.applySetting(*YtVisionSeed.Rpcs.setConfig(domain, content))
 
 
     def resetConfig (self, domain):
-        rpc = YtRpc()
-        rpc.func = (rpc.resetConfig)
-        rpc.strParams = (domain)
-        self.datalink.sendRpcMsg(rpc)
+        self.invalidate(('config', domain))
+        self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.resetConfig(domain))
 
 
     # Info
     def getDeviceInfo (self):
-        rpc = YtRpc()
-        rpc.func = (rpc.getDeviceInfo)
-        result = self.datalink.sendRpcMsg(rpc)
-        if (result.response):
-          return result.response.strData.split(' ')
+        result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.getDeviceInfo())
+        return YtVisionSeed.Rpcs.readDeviceInfo(result)
 
 
 
     # Face retrieve
     def getTracePic (self, traceId):
-        rpc = YtRpc()
-        rpc.func = (rpc.getTracePic)
-        rpc.intParams = (traceId)
-        resp = self.datalink.sendRpcMsg(rpc)
+        resp = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.getTracePic(traceId))
         return resp.response.filePart.data
 
     def getFacePic (self, faceId):
-        rpc = YtRpc()
-        rpc.func = (rpc.getFacePic)
-        rpc.intParams = (faceId)
-        resp = self.datalink.sendRpcMsg(rpc)
+        resp = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.getFacePic(faceId))
         return resp.response.filePart.data
 
     def clearFaceLib (self):
-        rpc = YtRpc()
-        rpc.func = (rpc.clearFaceLib)
-        self.datalink.sendRpcMsg(rpc)
+        self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.clearFaceLib())
 
     def setFaceId (self, faceId, faceName):
-        rpc = YtRpc()
-        rpc.func = (rpc.setFaceId)
-        params = SetFaceIdParams()
-        params.faceId = (faceId)
-        params.faceName = (faceName)
-        rpc.setFaceIdParams.CopyFrom(params)
-        self.datalink.sendRpcMsg(rpc)
+        self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.setFaceId(faceId, faceName))
 
     def registerFaceIdFromCamera (self, faceName, timeoutMs):
-        rpc = YtRpc()
-        rpc.func = (rpc.registerFaceIdFromCamera)
-        params = RegisterFaceIdFromCameraParams()
-        params.timeoutMs = (timeoutMs)
-        params.faceName = (faceName)
-        rpc.registerFaceIdFromCameraParams.CopyFrom(params)
-        result = self.datalink.sendRpcMsg(rpc)
-        if (result.HasField('response') and result.response.HasField('intData')):
-            return result.response.intData
-        else:
-            raise Exception('未知错误')
+        result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.registerFaceIdFromCamera(faceName, timeoutMs))
+        return YtVisionSeed.Rpcs.readFaceId(result)
 
 
     def registerFaceIdWithRemotePic (self, remoteFile, faceName):
-        rpc = YtRpc()
-        rpc.func = (rpc.registerFaceIdWithPic)
-        params = RegisterFaceIdWithPicParams()
-        params.filePath = (remoteFile)
-        params.faceName = (faceName)
-        rpc.registerFaceIdWithPicParams.CopyFrom(params)
-        result = self.datalink.sendRpcMsg(rpc)
-        # print(result.response)
-        if (result.HasField('response') and result.response.HasField('intData')):
-            return result.response.intData
-        else:
-            raise Exception('未知错误')
+        result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.registerFaceIdWithRemotePic(remoteFile, faceName))
+        return YtVisionSeed.Rpcs.readFaceId(result)
 
 
     def registerFaceIdWithPic (self, localFile, faceName, progressCb = None):
@@ -195,29 +514,17 @@ class YtVisionSeed:
         return faceId
 
     def deleteFaceId (self, faceId):
-        rpc = YtRpc()
-        rpc.func = (rpc.deleteFaceId)
-        rpc.intParams = (faceId)
-        self.datalink.sendRpcMsg(rpc)
+        self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.deleteFaceId(faceId))
 
     def deleteFaceName (self, faceName):
-        rpc = YtRpc()
-        rpc.func = (rpc.deleteFaceName)
-        rpc.strParams = (faceName)
-        resp = self.datalink.sendRpcMsg(rpc)
+        resp = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.deleteFaceName(faceName))
         return resp.response.intData
 
     def listFaceId (self):
         ret = []
         start = 0
         while (True):
-            rpc = YtRpc()
-            rpc.func = (rpc.listFaceId)
-            params = ListFaceIdParams()
-            params.start = (start)
-            params.length = (100)
-            rpc.listFaceIdParams.CopyFrom(params)
-            result = self.datalink.sendRpcMsg(rpc)
+            result = self.datalink.sendRpcMsg(YtVisionSeed.Rpcs.listFaceId(start))
             data = result.response.faceIdListData.faces
             if (len(data) == 0):
                 break
@@ -226,3 +533,95 @@ class YtVisionSeed:
             start = data[ len(data) - 1 ].faceId + 1
 
         return ret
+
+
+class YtVisionSeedBatch:
+    '''
+    Setter RPCs queued for YtVisionSeed.batch(), built by YtVisionSeed.Rpcs
+    like the setters of YtVisionSeed; send() transmits them back to back
+    and gathers every response.
+    '''
+    def __init__(self, vs, timeoutMs = 10000):
+        self.vs = vs
+        self.timeoutMs = timeoutMs
+        self.rpcs = []
+        self.settings = []     # (key, value) of each rpc, None for plain RPCs
+        self.responses = []
+
+    def __len__ (self):
+        return len(self.rpcs)
+
+    def queueRpc (self, rpc):
+        self.rpcs.append(rpc)
+        self.settings.append(None)
+
+    def applySetting (self, key, value, rpc):
+        # batched settings are always sent, and supersede a deferred write
+        self.vs.deferred.pop(key, None)
+        self.rpcs.append(rpc)
+        self.settings.append((key, value))
+
+    def setCamAutoExposure (self, camId):
+        self.applySetting(*YtVisionSeed.Rpcs.setCamAutoExposure(camId))
+
+    def setCamManualExposure (self, camId, timeUs, gain):
+        self.applySetting(*YtVisionSeed.Rpcs.setCamManualExposure(camId, timeUs, gain))
+
+    def setFlasher (self, flasherIR):
+        self.applySetting(*YtVisionSeed.Rpcs.setFlasher(flasherIR))
+
+    def setMainCamId (self, value):
+        self.applySetting(*YtVisionSeed.Rpcs.setMainCamId(value))
+
+    def setRotation (self, value):
+        self.applySetting(*YtVisionSeed.Rpcs.setRotation(value))
+
+    def setDebugDrawing (self, value):
+        self.applySetting(*YtVisionSeed.Rpcs.setDebugDrawing(value))
+
+    def setConfig (self, domain, content):
+        self.applySetting(*YtVisionSeed.Rpcs.setConfig(domain, content))
+
+    def resetConfig (self, domain):
+        self.vs.invalidate(('config', domain))
+        self.queueRpc(YtVisionSeed.Rpcs.resetConfig(domain))
+
+    def setFaceId (self, faceId, faceName):
+        self.queueRpc(YtVisionSeed.Rpcs.setFaceId(faceId, faceName))
+
+    def send (self):
+        '''
+        Send the queued RPCs and empty the batch. Returns one entry per
+        queued call, in order: None if it succeeded, else its error message
+        (getErrMsg text or 'Timeout'). The responses are kept in responses.
+        '''
+        rpcs = self.rpcs
+        settings = self.settings
+        self.rpcs = []
+        self.settings = []
+        results = self.vs.datalink.sendRpcBatch(rpcs, self.timeoutMs)
+        shadow = self.vs.shadow
+        for setting, result in zip(settings, results):
+            if (shadow is None or setting is None):
+                continue
+            key, value = setting
+            if isinstance(result, Exception):
+                shadow.pop(key, None)
+            else:
+                shadow[key] = value
+                self.vs.lastApplied[key] = time.monotonic()
+        self.responses = [None if isinstance(result, Exception) else result for result in results]
+        return [str(result) if isinstance(result, Exception) else None for result in results]
+
+    def __enter__ (self):
+        return self
+
+    def __exit__ (self, excType, exc, tb):
+        if not (excType is None):
+            return False
+        rpcs = self.rpcs
+        errors = self.send()
+        failed = ['%s: %s' % (YtRpc.Function.Name(rpc.func), err) for rpc, err in zip(rpcs, errors) if not (err is None)]
+        if (failed):
+            raise Exception('; '.join(failed))
+        return False
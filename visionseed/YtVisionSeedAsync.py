@@ -0,0 +1,383 @@
+# /**
+#  * asyncio interface of the VisionSeed
+#  * @example
+#     vs = await AsyncYtVisionSeed.openSerial(serial.Serial('/dev/ttyACM0', 115200))
+#     print(await vs.getDeviceInfo())
+#     async for result, msg in vs:
+#         ...
+#  */
+from .YtMsg_pb2 import *
+from .YtDataLink import YtDataLink
+from .YtFrameQueue import YtFrameQueue
+from .YtVisionSeed import YtVisionSeed
+import asyncio
+import collections
+import os
+
+class AsyncYtVisionSeed:
+    class StreamPort:
+        # Lets YtDataLink encode straight into an asyncio StreamWriter
+        def __init__(self, writer):
+            self.writer = writer
+        def read(self, size = 1):
+            return b''
+        def write(self, data):
+            self.writer.write(data)
+            return len(data)
+
+    class PipeWriter(asyncio.Protocol):
+        '''
+        The part of StreamWriter AsyncYtVisionSeed uses (write, drain, close,
+        wait_closed) over a write pipe transport, for openSerial.
+        '''
+        def __init__(self):
+            self.transport = None
+            self.resumed = None     # future while the transport is paused
+            self.closed = asyncio.get_running_loop().create_future()
+
+        def connection_made(self, transport):
+            self.transport = transport
+
+        def pause_writing(self):
+            self.resumed = asyncio.get_running_loop().create_future()
+
+        def resume_writing(self):
+            if not (self.resumed is None or self.resumed.done()):
+                self.resumed.set_result(None)
+            self.resumed = None
+
+        def connection_lost(self, exc):
+            self.resume_writing()
+            if not self.closed.done():
+                self.closed.set_result(None)
+
+        def write(self, data):
+            self.transport.write(data)
+
+        async def drain(self):
+            if not (self.resumed is None):
+                await asyncio.shield(self.resumed)
+            if (self.transport.is_closing()):
+                raise ConnectionResetError('Connection lost')
+
+        def close(self):
+            self.transport.close()
+
+        async def wait_closed(self):
+            await self.closed
+
+    def __init__(self, reader, writer, queueSize = 64, overflow = YtFrameQueue.DROP_OLDEST):
+        '''
+        reader/writer are an asyncio StreamReader/StreamWriter pair connected
+        to the device; see openSerial, openConnection and openUnixConnection.
+        Result frames are kept in a queue of queueSize, overflow follows the
+        YtFrameQueue policies. With BLOCK the responses of pending RPCs still
+        get through while the queue is full (see drainBacklog).
+        '''
+        if (overflow not in (YtFrameQueue.BLOCK, YtFrameQueue.DROP_OLDEST, YtFrameQueue.DROP_NEWEST)):
+            raise ValueError('unknown overflow policy: %s' % overflow)
+        self.reader = reader
+        self.writer = writer
+        self.datalink = YtDataLink(AsyncYtVisionSeed.StreamPort(writer))
+        self.overflow = overflow
+        self.frameQueue = asyncio.Queue(queueSize)
+        self.dropped = 0
+        self.backlog = collections.deque()
+        self.pending = {}
+        self.closed = False
+        self.readTransport = None
+        self.recvTask = asyncio.ensure_future(self.recvLoop())
+
+    @classmethod
+    async def openSerial (cls, port, **kwargs):
+        '''
+        Drive an opened pyserial port from the event loop (POSIX only, the
+        tty fd is registered with the loop like a pipe).
+        '''
+        loop = asyncio.get_running_loop()
+        reader = asyncio.StreamReader()
+        readTransport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+            os.fdopen(os.dup(port.fileno()), 'rb', buffering = 0))
+        _, writer = await loop.connect_write_pipe(AsyncYtVisionSeed.PipeWriter,
+            os.fdopen(os.dup(port.fileno()), 'wb', buffering = 0))
+        vs = cls(reader, writer, **kwargs)
+        vs.readTransport = readTransport
+        return vs
+
+    @classmethod
+    async def openConnection (cls, host = None, port = None, sock = None, **kwargs):
+        # TCP bridge to the device, or an already connected socket (e.g. socketpair in tests)
+        reader, writer = await asyncio.open_connection(host, port, sock = sock)
+        return cls(reader, writer, **kwargs)
+
+    @classmethod
+    async def openUnixConnection (cls, path, **kwargs):
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer, **kwargs)
+
+    async def close (self):
+        self.closed = True
+        self.recvTask.cancel()
+        try:
+            await self.recvTask
+        except asyncio.CancelledError:
+            pass
+        self.writer.close()
+        if not (self.readTransport is None):
+            self.readTransport.close()
+        await self.writer.wait_closed()
+
+    def subscribe (self, patterns):
+        # see YtVisionSeed.subscribe
+        self.datalink.subscribe(patterns)
+
+    def droppedFrames (self):
+        return self.dropped
+
+    async def recvLoop (self):
+        deframer = self.datalink.deframer
+        try:
+            while True:
+                data = await self.reader.read(self.datalink.maxReadSize)
+                if not data:
+                    break
+                deframer.feed(data)
+                while True:
+                    payload = deframer.next()
+                    if (payload is None):
+                        break
+                    dataV2, msg = self.datalink.parseYtMsg(payload)
+                    if (msg.HasField('response')):
+                        future = self.pending.pop(msg.response.sequenceId, None)
+                        if not (future is None):
+                            if not future.done():
+                                future.set_result(msg)
+                            continue
+                    if not (dataV2 is None):
+                        dataV2.keep()
+                    await self.putFrame((dataV2, msg))
+        finally:
+            self.closed = True
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(Exception('Connection closed'))
+            self.pending.clear()
+            self.refill()
+            self.dropped += len(self.backlog)
+            self.backlog.clear()
+            # wake up the consumer, a None frame ends the iteration
+            while True:
+                try:
+                    self.frameQueue.put_nowait(None)
+                    break
+                except asyncio.QueueFull:
+                    self.frameQueue.get_nowait()
+
+    async def putFrame (self, frame):
+        if (self.overflow == YtFrameQueue.BLOCK):
+            self.backlog.append(frame)
+            await self.drainBacklog()
+            return
+        if self.frameQueue.full():
+            self.dropped += 1
+            if (self.overflow == YtFrameQueue.DROP_NEWEST):
+                return
+            self.frameQueue.get_nowait()
+        self.frameQueue.put_nowait(frame)
+
+    async def drainBacklog (self):
+        '''
+        Move the held frames into a full BLOCK frameQueue without starving the
+        RPCs: while an RPC is pending recvLoop reads on, responses are
+        dispatched and the frames wait here, at most queueSize of them (the
+        oldest are dropped and counted in droppedFrames). With no RPC pending
+        recvLoop just waits for the consumer.
+        '''
+        backlog = self.backlog
+        while backlog:
+            self.refill()
+            if not backlog:
+                break
+            if self.pending:
+                while (len(backlog) > self.frameQueue.maxsize):
+                    backlog.popleft()
+                    self.dropped += 1
+                break
+            # wake up now and then to see if an RPC was sent meanwhile
+            try:
+                await asyncio.wait_for(self.frameQueue.put(backlog[0]), 0.01)
+                backlog.popleft()
+            except asyncio.TimeoutError:
+                pass
+
+    def refill (self):
+        # held frames move up as soon as the consumer makes room
+        while (self.backlog and not self.frameQueue.full()):
+            self.frameQueue.put_nowait(self.backlog.popleft())
+
+    async def recv (self, timeout = None):
+        '''
+        Next (DataV2, YtMsg) pair that is not an RPC response, (None, None) on
+        timeout or once the connection is closed.
+        '''
+        try:
+            frame = await asyncio.wait_for(self.frameQueue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None, None
+        if (frame is None):
+            self.frameQueue.put_nowait(None)
+            return None, None
+        self.refill()
+        return frame
+
+    def __aiter__ (self):
+        return self
+
+    async def __anext__ (self):
+        frame = await self.frameQueue.get()
+        if (frame is None):
+            self.frameQueue.put_nowait(None)
+            raise StopAsyncIteration
+        self.refill()
+        return frame
+
+    async def sendRpcMsg (self, rpc, timeoutMs = 10000):
+        if (self.closed):
+            raise Exception('Connection closed')
+        rpcid = self.datalink.genRpcId()
+        rpc.sequenceId = rpcid
+
+        msg = YtMsg()
+        msg.rpc.CopyFrom(rpc)
+
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rpcid] = future
+        try:
+            self.datalink.sendYtMsg(msg)
+            await self.writer.drain()
+            resp = await asyncio.wait_for(future, timeoutMs/1000)
+        except asyncio.TimeoutError:
+            raise Exception('Timeout')
+        finally:
+            self.pending.pop(rpcid, None)
+
+        if (resp.response.code != YtRpcResponse.ReturnCode.SUCC and
+            resp.response.code != YtRpcResponse.ReturnCode.CONTINUE):
+            err = self.datalink.getErrMsg(resp.response.code)
+            raise Exception(err)
+        return resp
+
+    async def sendFile (self, localFile, remoteFile, auth = '', progressCb = None):
+        with open(localFile, mode='rb') as file:
+            data = file.read()
+
+        totalLength = len(data)
+        currentOffset = 0
+        while (currentOffset < totalLength):
+            sizeToTransmit = min(YtDataLink.fileBlobSize, totalLength - currentOffset)
+            rpc = YtDataLink.uploadFileRpc(remoteFile, totalLength, data[currentOffset : currentOffset + sizeToTransmit], currentOffset, auth)
+            for i in range(100):
+                try:
+                    result = await self.sendRpcMsg(rpc, 10000)
+                    if (not result.HasField('response')):
+                        raise Exception('未知错误')
+                    break
+                except Exception as e:
+                    if (i > 10):
+                        raise e
+            currentOffset += sizeToTransmit
+            if not (progressCb is None):
+                progressCb(int(currentOffset / totalLength * 100))
+
+    # The calls of YtVisionSeed, built by YtVisionSeed.Rpcs; settings are
+    # always sent, there is no shadow state here.
+
+    # Camera
+    async def setCamAutoExposure (self, camId):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setCamAutoExposure(camId)[2])
+
+    async def setCamManualExposure (self, camId, timeUs, gain):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setCamManualExposure(camId, timeUs, gain)[2])
+
+    async def setFlasher (self, flasherIR):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setFlasher(flasherIR)[2])
+
+    async def setMainCamId (self, value):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setMainCamId(value)[2])
+
+    async def setRotation (self, value):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setRotation(value)[2])
+
+    async def setDebugDrawing (self, value):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setDebugDrawing(value)[2])
+
+
+    # Files
+    async def listFile (self, path):
+        return YtVisionSeed.Rpcs.readFileList(await self.sendRpcMsg(YtVisionSeed.Rpcs.listFile(path)))
+
+    async def deleteFile (self, path, auth = ''):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.deleteFile(path, auth))
+
+    async def getConfig (self, domain):
+        return YtVisionSeed.Rpcs.readConfig(await self.sendRpcMsg(YtVisionSeed.Rpcs.getConfig(domain)))
+
+    async def setConfig (self, domain, content):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setConfig(domain, content)[2])
+
+    async def resetConfig (self, domain):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.resetConfig(domain))
+
+
+    # Info
+    async def getDeviceInfo (self):
+        return YtVisionSeed.Rpcs.readDeviceInfo(await self.sendRpcMsg(YtVisionSeed.Rpcs.getDeviceInfo()))
+
+
+    # Face retrieve
+    async def getTracePic (self, traceId):
+        resp = await self.sendRpcMsg(YtVisionSeed.Rpcs.getTracePic(traceId))
+        return resp.response.filePart.data
+
+    async def getFacePic (self, faceId):
+        resp = await self.sendRpcMsg(YtVisionSeed.Rpcs.getFacePic(faceId))
+        return resp.response.filePart.data
+
+    async def clearFaceLib (self):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.clearFaceLib())
+
+    async def setFaceId (self, faceId, faceName):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.setFaceId(faceId, faceName))
+
+    async def registerFaceIdFromCamera (self, faceName, timeoutMs):
+        return YtVisionSeed.Rpcs.readFaceId(await self.sendRpcMsg(YtVisionSeed.Rpcs.registerFaceIdFromCamera(faceName, timeoutMs)))
+
+    async def registerFaceIdWithRemotePic (self, remoteFile, faceName):
+        return YtVisionSeed.Rpcs.readFaceId(await self.sendRpcMsg(YtVisionSeed.Rpcs.registerFaceIdWithRemotePic(remoteFile, faceName)))
+
+    async def registerFaceIdWithPic (self, localFile, faceName, progressCb = None):
+        remoteFile = '/tmp/reg.jpg'
+        await self.sendFile(localFile, remoteFile, '', progressCb)
+        faceId = await self.registerFaceIdWithRemotePic(remoteFile, faceName)
+        return faceId
+
+    async def deleteFaceId (self, faceId):
+        await self.sendRpcMsg(YtVisionSeed.Rpcs.deleteFaceId(faceId))
+
+    async def deleteFaceName (self, faceName):
+        resp = await self.sendRpcMsg(YtVisionSeed.Rpcs.deleteFaceName(faceName))
+        return resp.response.intData
+
+    async def listFaceId (self):
+        ret = []
+        start = 0
+        while (True):
+            result = await self.sendRpcMsg(YtVisionSeed.Rpcs.listFaceId(start))
+            data = result.response.faceIdListData.faces
+            if (len(data) == 0):
+                break
+
+            ret = ret + list(data)
+            start = data[ len(data) - 1 ].faceId + 1
+
+        return ret
@@ -0,0 +1,142 @@
+# /**
+#  * Thread-safe VisionSeed client: one thread owns the port
+#  */
+from .YtDataLink import YtDataLink
+from .YtFrameQueue import YtFrameQueue
+from .YtVisionSeed import YtVisionSeed
+import collections
+import threading
+
+class YtVisionSeedClient(YtVisionSeed):
+    '''
+    YtVisionSeed for programs with several threads. A single owner thread
+    does every port read and write, so the deframer, the send CRC and the
+    port itself are never touched concurrently. Any thread may call the RPC
+    methods (each waits for its own response by sequenceId, up to
+    maxInFlight are pipelined) and any number of threads may consume
+    results, each from its own stream. With shadowState the writes of each
+    setting are serialized (see settingLock).
+    '''
+    class DataLink(YtDataLink):
+        '''
+        YtDataLink whose write() only queues the payload; the reader thread
+        encodes and writes it between reads. While the port is idle the
+        thread sleeps up to pollInterval seconds, or until a write is queued.
+        '''
+        def __init__(self, port, pollInterval = 0.002, **kwargs):
+            self.outbox = collections.deque()
+            self.outboxCond = threading.Condition()
+            self.pollInterval = pollInterval
+            super().__init__(port, **kwargs)
+
+        def write (self, data):
+            if (self.reader is None or self.reader is threading.current_thread()):
+                YtDataLink.write(self, data)
+                return
+            with self.outboxCond:
+                self.outbox.append(bytes(data))
+                self.outboxCond.notify()
+
+        def readerLoop (self):
+            # ports without in_waiting are read blocking, writes then wait for the read timeout
+            polling = hasattr(self.port, 'in_waiting')
+            idle = False
+            while self.readerRunning:
+                with self.outboxCond:
+                    if (idle and not self.outbox):
+                        self.outboxCond.wait(self.pollInterval)
+                    outbox = self.outbox
+                    self.outbox = collections.deque()
+                try:
+                    for data in outbox:
+                        YtDataLink.write(self, data)
+                    if (polling and self.port.in_waiting == 0):
+                        # nothing to read: only route frames deframed already,
+                        # a blocking read would hold up the writes
+                        payload = self.deframer.next()
+                        idle = payload is None
+                        if not (idle):
+                            self.routeMessage(*self.parseYtMsg(payload))
+                        continue
+                except Exception as e:
+                    self.readerFailed(e)
+                    break
+                idle = False
+                if not self.readerStep():
+                    break
+
+    class Streams:
+        # fans every received message out to the open streams
+        def __init__(self):
+            self.lock = threading.Lock()
+            self.queues = []
+
+        def put(self, item):
+            with self.lock:
+                queues = list(self.queues)
+            for queue in queues:
+                queue.put(item)
+
+        def close(self):
+            with self.lock:
+                queues = self.queues
+                self.queues = []
+            for queue in queues:
+                queue.close()
+
+    datalinkClass = DataLink
+
+    def __init__(self, port, queueSize = 64, overflow = YtFrameQueue.DROP_OLDEST, pollInterval = 0.002, **kwargs):
+        '''
+        queueSize/overflow size the default stream read by recvRunOnce and
+        results(). Streams may only drop frames, a blocked consumer must not
+        stall the port for everyone.
+        '''
+        self.streams = YtVisionSeedClient.Streams()
+        super().__init__(port, readerThread = False, queueSize = queueSize, **kwargs)
+        self.datalink.pollInterval = pollInterval
+        self.frameQueue = self.openStream(queueSize, overflow)
+        self.datalink.startReader(self.streams)
+
+    def openStream (self, queueSize = 64, overflow = YtFrameQueue.DROP_OLDEST):
+        '''
+        A new YtFrameQueue receiving every (DataV2, YtMsg) from now on, for
+        one consumer thread; pass it to results(stream = ...) or get() from
+        it directly. Frames it drops are counted in its dropped.
+        '''
+        if (overflow == YtFrameQueue.BLOCK):
+            raise ValueError('client streams must drop frames, not block')
+        queue = YtFrameQueue(queueSize, overflow)
+        with self.streams.lock:
+            self.streams.queues.append(queue)
+        return queue
+
+    def closeStream (self, queue):
+        with self.streams.lock:
+            if queue in self.streams.queues:
+                self.streams.queues.remove(queue)
+        queue.close()
+
+    def results (self, timeout = None, stream = None):
+        '''
+        As YtVisionSeed.results, from stream (the default stream if None).
+        '''
+        stream = self.frameQueue if stream is None else stream
+        while True:
+            frame = stream.get(timeout)
+            if (frame is None):
+                return
+            self.flushDue()
+            yield self.toEvent(*frame)
+
+    def startReader (self, queueSize = 64, overflow = YtFrameQueue.DROP_OLDEST):
+        # the owner thread runs from construction until close()
+        raise Exception('YtVisionSeedClient reads the port on its own thread already')
+
+    def stopReader (self):
+        self.close()
+
+    def close (self):
+        # stop the owner thread, fail pending RPCs and end every stream
+        self.datalink.stopReader()
+        self.streams.close()
@@ -1,4 +1,9 @@
 from .YtMsg_pb2 import *
 from .YtVisionSeed import YtVisionSeed
-from .YtDataLink import YtDataLink
+from .YtDataLink import YtDataLink, crcCcitt
 from .YtFaceAlignment import YtFaceShape
+from .YtFrameQueue import YtFrameQueue
+from .YtFrameJoiner import YtFrameJoiner
+from .YtRpcEngine import YtRpcEngine
+from .YtVisionSeedAsync import AsyncYtVisionSeed
+from .YtVisionSeedClient import YtVisionSeedClient
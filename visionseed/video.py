@@ -0,0 +1,165 @@
+# /**
+#  * Colour conversion of the raw UVC frames of the VisionSeed
+#  */
+import numpy as np
+try:
+    import cv2
+except ImportError:
+    # no OpenCV, the NumPy tables below do the conversion
+    cv2 = None
+
+_SHIFT = 20
+
+def _tables(yScale, yOffset, ub, ug, vg, vr):
+    # per 8-bit sample terms of B, G and R in 20-bit fixed point
+    samples = np.arange(256, dtype = np.float64)
+    chroma = samples - 128
+    return tuple(np.round(x * (1 << _SHIFT)).astype(np.int32) for x in (
+        np.maximum(samples - yOffset, 0) * yScale + 0.5, chroma * ub, chroma * ug, chroma * vg, chroma * vr))
+
+# Full range, the coefficients of cv2.COLOR_YUV2BGR: what example-cocos2d.py
+# applied to its merged planes, Y=16/128/235 stay 16/128/235
+FULL_RANGE = _tables(1, 0, 2.032, -0.395, -0.581, 1.140)
+# BT.601 limited range, the coefficients of cv2.COLOR_YUV2BGR_I420:
+# Y=16..235 is stretched to 0..255
+LIMITED_RANGE = _tables(255 / 219, 16, 2.018, -0.391, -0.813, 1.596)
+
+# chroma rows converted per step, the int32 temporaries of a band stay in cache
+_BAND = 16
+
+def planeShape(frame, width, height):
+    # the (height * 3 / 2, width) uint8 layout cv2 delivers with CAP_PROP_CONVERT_RGB off
+    frame = np.asarray(frame)
+    if (width is None or height is None):
+        if (frame.ndim != 2 or frame.shape[0] % 3 != 0):
+            raise ValueError('pass width and height for a %s frame' % (frame.shape,))
+        height = frame.shape[0] * 2 // 3
+        width = frame.shape[1]
+    if (width % 2 or height % 2):
+        raise ValueError('width and height must be even')
+    if (frame.size != width * height * 3 // 2):
+        raise ValueError('%d bytes is not a %dx%d 4:2:0 frame' % (frame.size, width, height))
+    if (frame.dtype != np.uint8):
+        raise ValueError('frame must be uint8')
+    return frame.reshape(-1), width, height
+
+def outputBuffer(out, width, height):
+    if (out is None):
+        return np.empty((height, width, 3), np.uint8)
+    if (out.shape != (height, width, 3) or out.dtype != np.uint8 or not out.flags.c_contiguous):
+        raise ValueError('out must be a contiguous (%d, %d, 3) uint8 array' % (height, width))
+    return out
+
+def yuvToBgr(y, u, v, out, tables = FULL_RANGE):
+    '''
+    y is (height, width), u and v are (height / 2, width / 2); writes BGR
+    into out. Each chroma sample is broadcast over the 2x2 luma block it
+    covers (nearest neighbour, where cv2.resize interpolated bilinearly),
+    through (rows, 2, columns, 2) views. The frame is converted in bands of
+    _BAND chroma rows, so only band-sized temporaries are allocated.
+    '''
+    height, width = y.shape
+    rows = height // 2
+    columns = width // 2
+    Y, UB, UG, VG, VR = tables
+    band = min(_BAND, rows)
+    luma = np.empty((band, 2, columns, 2), np.int32)
+    acc = np.empty_like(luma)
+    chroma = np.empty((3, band, columns), np.int32)
+    scratch = np.empty((band, columns), np.int32)
+    for top in range(0, rows, band):
+        stop = min(top + band, rows)
+        n = stop - top
+        np.take(Y, y[2 * top : 2 * stop].reshape(n, 2, columns, 2), out = luma[:n], mode = 'clip')
+        np.take(UB, u[top : stop], out = chroma[0, :n], mode = 'clip')
+        np.take(UG, u[top : stop], out = chroma[1, :n], mode = 'clip')
+        np.take(VG, v[top : stop], out = scratch[:n], mode = 'clip')
+        chroma[1, :n] += scratch[:n]
+        np.take(VR, v[top : stop], out = chroma[2, :n], mode = 'clip')
+        dst = out[2 * top : 2 * stop].reshape(n, 2, columns, 2, 3)
+        for channel in range(3):
+            np.add(luma[:n], chroma[channel, :n, None, :, None], out = acc[:n])
+            np.right_shift(acc[:n], _SHIFT, out = acc[:n])
+            np.clip(acc[:n], 0, 255, out = acc[:n])
+            dst[..., channel] = acc[:n]
+    return out
+
+def cv2FullRange(y, uv, out):
+    # cv2 only converts 4:2:0 frames with limited range levels: scale the
+    # chroma up (nearest neighbour, as yuvToBgr) and convert the merged
+    # planes with cv2.COLOR_YUV2BGR
+    height, width = y.shape
+    uv = [cv2.resize(plane, (width, height), interpolation = cv2.INTER_NEAREST) for plane in uv]
+    return cv2.cvtColor(cv2.merge([y] + uv), cv2.COLOR_YUV2BGR, dst = out)
+
+def i420ToBgr(frame, width = None, height = None, out = None, fullRange = True):
+    '''
+    Convert an I420 frame (Y plane, then U, then V) to a (height, width, 3)
+    BGR uint8 array. frame is the raw UVC capture, either the 2-D
+    (height * 3 / 2, width) array cv2 delivers (width/height may then be
+    omitted) or any flat buffer. Pass out to reuse a preallocated
+    (height, width, 3) array; it is returned. fullRange keeps the levels of
+    cv2.COLOR_YUV2BGR, False gives the BT.601 limited range conversion of
+    cv2.COLOR_YUV2BGR_I420. The conversion runs in cv2 when OpenCV is
+    installed, yuvToBgr is the fallback without it.
+    '''
+    frame, width, height = planeShape(frame, width, height)
+    out = outputBuffer(out, width, height)
+    size = width * height
+    y = frame[: size].reshape(height, width)
+    u = frame[size : size + size // 4].reshape(height // 2, width // 2)
+    v = frame[size + size // 4 :].reshape(height // 2, width // 2)
+    if (cv2 is None):
+        return yuvToBgr(y, u, v, out, FULL_RANGE if fullRange else LIMITED_RANGE)
+    if (fullRange):
+        return cv2FullRange(y, [u, v], out)
+    return cv2.cvtColor(frame.reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420, dst = out)
+
+def nv12ToBgr(frame, width = None, height = None, out = None, fullRange = True):
+    # as i420ToBgr for NV12, a Y plane followed by interleaved U/V samples
+    frame, width, height = planeShape(frame, width, height)
+    out = outputBuffer(out, width, height)
+    size = width * height
+    y = frame[: size].reshape(height, width)
+    uv = frame[size :].reshape(height // 2, width // 2, 2)
+    if (cv2 is None):
+        return yuvToBgr(y, uv[..., 0], uv[..., 1], out, FULL_RANGE if fullRange else LIMITED_RANGE)
+    if (fullRange):
+        return cv2FullRange(y, [uv], out)
+    return cv2.cvtColor(frame.reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_NV12, dst = out)
+
+def frameIds(frames, width = None, height = None, previous = None, maxGap = 3600):
+    '''
+    The frameIds the device stamps into the four corner luma pixels of each
+    raw frame (top-left is the most significant byte), read before any
+    colour conversion. frames is one raw frame or a stack of them, as
+    i420ToBgr takes. Returns (ids, valid): uint32 frameIds and a mask of
+    those 1..maxGap after their predecessor (previous for the first, which
+    is taken as valid when previous is None), modulo 2**32. A repeated,
+    backwards or far-off id usually means a frame from old firmware.
+    '''
+    frames = np.asarray(frames)
+    if (width is None or height is None):
+        if (frames.ndim < 2 or frames.shape[-2] % 3 != 0):
+            raise ValueError('pass width and height for %s frames' % (frames.shape,))
+        height = frames.shape[-2] * 2 // 3
+        width = frames.shape[-1]
+    size = width * height * 3 // 2
+    if (frames.dtype != np.uint8):
+        raise ValueError('frames must be uint8')
+    if (frames.size == 0 or frames.size % size != 0):
+        raise ValueError('%d bytes are not whole %dx%d 4:2:0 frames' % (frames.size, width, height))
+    corners = frames.reshape(-1, size)[:, [0, width - 1, (height - 1) * width, height * width - 1]]
+    corners = corners.astype(np.uint32)
+    ids = (corners[:, 0] << 24) | (corners[:, 1] << 16) | (corners[:, 2] << 8) | corners[:, 3]
+    before = np.empty_like(ids)
+    before[1:] = ids[:-1]
+    before[0] = (int(ids[0]) - 1 if previous is None else previous) & 0xffffffff
+    gap = ids - before
+    valid = (gap >= 1) & (gap <= maxGap)
+    return ids, valid
+
+def frameId(frame, width = None, height = None):
+    # frameId of a single raw frame, without the batch bookkeeping
+    frame, width, height = planeShape(frame, width, height)
+    return (int(frame[0]) << 24) | (int(frame[width - 1]) << 16) | (int(frame[(height - 1) * width]) << 8) | int(frame[height * width - 1])